@@ -1,33 +1,61 @@
 import pandas as pd
 import numpy as np
 import math
-import ipysheet
-import ipywidgets as w
 import functools
 import os
-import pyperclip
 import warnings
-from IPython.display import display
+import inspect
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from . import gui
+from . import storage
+from . import random_variables
+from . import solution_cache
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
-class Assignment:
+class Sheet:
+    """ Assignment attribute stored in a sheet of the data file. It is
+        loaded from the storage on first access and cached after that.
+        Replacing it marks it as modified for the next save.
+    """
 
-    def __init__(self, from_file=False):
-        self.config = pd.DataFrame()
-        self.student_list = pd.DataFrame()
-        self.var_config = pd.DataFrame()
-        self.variables = pd.DataFrame()
-        self.solutions = pd.DataFrame()
-        self.answers = pd.DataFrame()
-        self.grading_config = pd.DataFrame()
-        self.grades = pd.DataFrame()
+    # Sheets are loaded once even if several threads use them
+    lock = threading.RLock()
 
-        self.email_template = 'email_template.html'
-        self.grades_email_template = 'grade_email_template.html'
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        if self.name in instance._unloaded:
+            with self.lock:
+                if self.name in instance._unloaded:
+                    instance.load_sheets([self.name])
+
+        return instance.__dict__[self.name]
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+        instance._modified.add(self.name)
+        instance._unloaded.discard(self.name)
+
+
+class Assignment:
 
+    config = Sheet()
+    student_list = Sheet()
+    var_config = Sheet()
+    variables = Sheet()
+    solutions = Sheet()
+    answers = Sheet()
+    grading_config = Sheet()
+    grades = Sheet()
+
+    def __init__(self, from_file=False, sheets=None):
         self._sheets = {
             'config': 'configuration',
             'student_list': 'students',
@@ -39,39 +67,100 @@ class Assignment:
             'grades': 'grades'
         }
 
+        # Attributes replaced since the last save, fingerprints of the saved
+        # attributes and storage backend used in the last save
+        self._modified = set()
+        self._saved = {}
+        self._store_name = None
+
+        # Storage the data was loaded from, attributes not loaded yet and
+        # attributes loaded from it
+        self._store = None
+        self._unloaded = set()
+        self._loaded = set()
+
+        self.config = pd.DataFrame()
+        self.student_list = pd.DataFrame()
+        self.var_config = pd.DataFrame()
+        self.variables = pd.DataFrame()
+        self.solutions = pd.DataFrame()
+        self.answers = pd.DataFrame()
+        self.grading_config = pd.DataFrame()
+        self.grades = pd.DataFrame()
+
+        self.email_template = 'email_template.html'
+        self.grades_email_template = 'grade_email_template.html'
+
         if from_file:
-            self.load_from_file()
+            self.load_from_file(sheets)
 
         os.makedirs('gen', exist_ok=True)
         os.makedirs('sheets', exist_ok=True)
 
-    def load_from_file(self):
-        """ Loads attributes from XSLX file
+    def load_from_file(self, sheets=None):
+        """ Finds the data stored in gen folder (XLSX workbook or
+            Parquet/Feather files). Attributes are loaded when they are used
+            for the first time, so only the sheets that are needed are
+            parsed.
+
+        Args:
+            sheets ([str], optional): Attributes to load now (e.g.
+                                      ['config', 'student_list']).
+                                      Defaults to None.
         """
 
         print('------')
-        try:
-            fe = open('gen/data.xlsx', 'rb')
-        except FileNotFoundError:
+        self._store = storage.find_storage()
+        if self._store is None:
             print('Data file not found')
-        else:
-            print('Loading data')
-            for key in self._sheets.keys():
-                key_str = self._sheets[key]
-                try:
-                    data = pd.read_excel(fe, sheet_name=self._sheets[key])
-                except ValueError as ve:
-                    print(f'** {key_str} ... Data not loaded')
-                    print(f'**** Error: {ve}')
+            return
+
+        print(f'Loading data ({self._store.name})')
+        self._unloaded = set(self._sheets.keys())
+        self._loaded = set()
+        self._store_name = self._store.name
+
+        if sheets is not None:
+            self.load_sheets(sheets)
+
+    def load_sheets(self, keys):
+        """ Loads attributes from the storage the data was loaded from
+
+        Args:
+            keys ([str]): attribute names
+        """
+
+        keys = list(keys)
+        if not keys:
+            return
+
+        for key in keys:
+            key_str = self._sheets[key]
+            try:
+                data = self._store.load(key_str)
+            except ValueError as ve:
+                data = pd.DataFrame()
+                print(f'** {key_str} ... Data not loaded')
+                print(f'**** Error: {ve}')
+            else:
+                if not data.empty:
+                    print(f'-- {key_str} ... Data loaded')
                 else:
-                    if not data.empty:
-                        sheet_name = self._sheets[key]
-                        setattr(self,
-                                key,
-                                pd.read_excel(fe, sheet_name=sheet_name))
-                        print(f'-- {key_str} ... Data loaded')
-                    else:
-                        print(f'-- {key_str} ... There is no data in the file')
+                    print(f'-- {key_str} ... There is no data in the file')
+
+            setattr(self, key, data)
+            self._loaded.add(key)
+
+        self.mark_saved(keys, self._store.name)
+
+    def loaded_sheets(self):
+        """ Lists the attributes loaded from the data file so far
+
+        Returns:
+            [str]: attribute names
+        """
+
+        return [key for key in self._sheets.keys() if key in self._loaded]
 
     def configure(self):
         """ Creates Jupyter notebook interface to populate self.config
@@ -80,6 +169,9 @@ class Assignment:
             ipywidget: ipywigtes layout with congiguration GUI.
         """
 
+        import ipysheet
+        import ipywidgets as w
+
         columns = ['Variable', 'Value']
         variable_names = ['Greeting',
                           'Assignment name',
@@ -89,7 +181,9 @@ class Assignment:
                           'Professor name',
                           'Number of questions',
                           'Number of sheets',
-                          'Password']
+                          'Password',
+                          'Storage backend',
+                          'Random seed']
 
         rows = len(variable_names)
 
@@ -100,10 +194,8 @@ class Assignment:
 
         ipysheet.column(0, variable_names, read_only=True)
 
-        if self.config.empty:
-            ipysheet.column(1, [''] * rows)
-        else:
-            ipysheet.column(1, self.config['Value'].to_list())
+        values = [self.get_config(name, '') for name in variable_names]
+        ipysheet.column(1, values)
 
         config_table.column_width = [5, 10]
         config_table.layout = w.Layout(width='500px',
@@ -132,6 +224,8 @@ class Assignment:
             _ (): Dummy variable
         """
 
+        import ipysheet
+
         self.config = ipysheet.to_dataframe(config)
         save = []
 
@@ -149,6 +243,12 @@ class Assignment:
             print('Number of questions has to be an integer')
             save.append(False)
 
+        backend = self.get_config('Storage backend')
+        if backend and backend not in storage.backends:
+            print(f'Storage backend has to be one of '
+                  f'{list(storage.backends)}')
+            save.append(False)
+
         if all(save):
             self.save_file()
             print('------')
@@ -165,6 +265,8 @@ class Assignment:
             _ (): Dummy variable
         """
 
+        import ipysheet
+
         self.var_config = ipysheet.to_dataframe(table)
 
         # Deletes lines with no variable name
@@ -179,39 +281,206 @@ class Assignment:
         self.var_config['Step'] = self.var_config['Step'].astype(float)
         self.var_config['Decimals'] = self.var_config['Decimals'].astype(int)
 
+        for column in ['Constraint', 'Expression']:
+            expressions = self.var_config[column].fillna('').astype(str)
+            self.var_config[column] = expressions.str.strip()
+
         print('------')
         print('Variable generation configuration saved')
 
         self.save_file()
 
-    def save_file(self):
-        """ Saves atttribute values to XLSX file
+    def save_file(self, full=False):
+        """ Saves the attributes modified since the last save using the
+            storage backend selected in the configuration (XLSX by default).
+            All the attributes are saved if the backend has changed.
+
+        Args:
+            full (bool, optional): True to save all the attributes.
+                                   Defaults to False.
+        """
+
+        backend = self.get_config('Storage backend') or 'xlsx'
+
+        # the storage the data was loaded from is reused, so the XLSX
+        # workbook it keeps open is closed before the file is replaced
+        if self._store is not None and self._store.name == backend:
+            store = self._store
+        else:
+            store = storage.get_storage(backend)
+
+        full = full or store.name != self._store_name
+
+        if full:
+            keys = list(self._sheets.keys())
+        else:
+            keys = self.modified_sheets()
+
+        if not keys:
+            print('------')
+            print('No changes to save')
+            return
+
+        # Attributes not loaded yet are written again when the whole data
+        # (or the single file of the XLSX workbook) is saved
+        if full or not store.partial:
+            self.load_sheets(self._unloaded)
+
+        saved = self.write_storage(store, keys)
+        self.mark_saved(saved, store.name)
+
+        if store is not self._store:
+            if isinstance(self._store, storage.ExcelStorage):
+                self._store.close()
+            self._store = store
+
+    def modified_sheets(self):
+        """ Lists the attributes modified since the last save, either
+            replaced or changed in place
+
+        Returns:
+            [str]: attribute names
+        """
+
+        modified = []
+
+        for key in self._sheets.keys():
+            if key in self._unloaded:
+                continue
+            elif key in self._modified:
+                modified.append(key)
+            else:
+                current = storage.fingerprint(getattr(self, key))
+                if current is None or current != self._saved.get(key):
+                    modified.append(key)
+
+        return modified
+
+    def mark_saved(self, keys, store_name):
+        """ Records the attributes as saved in a storage
+
+        Args:
+            keys ([str]): attribute names
+            store_name (str): storage backend name
         """
 
+        for key in keys:
+            self._saved[key] = storage.fingerprint(getattr(self, key))
+            self._modified.discard(key)
+
+        self._store_name = store_name
+
+    def export_xlsx(self, path='gen/mail_merge.xlsx'):
+        """ Exports all the attributes to a XLSX file (e.g. for the Word
+            mail-merge with the variables sheet). The file is not the XLSX
+            storage (gen/data.xlsx), so the data keeps being loaded from
+            the configured backend.
+
+        Args:
+            path (str, optional): XLSX file path.
+                                  Defaults to 'gen/mail_merge.xlsx'.
+        """
+
+        self.load_sheets(self._unloaded)
+        self.write_storage(storage.ExcelStorage(path))
+
+    def write_storage(self, store, keys=None):
+        """ Writes attribute values to a storage. Storages with a single
+            file (XLSX) always receive all the attributes.
+
+        Args:
+            store (ExcelStorage, ParquetStorage or FeatherStorage): storage
+            keys ([str], optional): attribute names to write. Defaults to
+                                    all the attributes.
+
+        Returns:
+            [str]: attribute names saved without errors
+        """
+
+        if keys is None or not store.partial:
+            keys = list(self._sheets.keys())
+
+        frames = {self._sheets[key]: getattr(self, key) for key in keys}
+
         try:
-            writer = pd.ExcelWriter("gen/data.xlsx", engine='openpyxl')
+            print('------')
+            print(f'Saving data file ({store.name})')
+            errors = store.save(frames)
         except FileNotFoundError:
             print('gen folder not found')
+            return []
+
+        for sheet in frames.keys():
+            if sheet in errors:
+                print(f'** {sheet} ... couldn´t be saved')
+                print(f'**** Error: {errors[sheet]}')
+            else:
+                print(f'-- {sheet} ... Saved')
+
+        print('------')
+        print('Data saved in file')
+
+        return [key for key in keys if self._sheets[key] not in errors]
+
+    def get_config(self, variable, default=None):
+        """ Gets a value from the configuration by variable name
+
+        Args:
+            variable (str): Variable name (e.g. 'Storage backend')
+            default (optional): Value returned if the variable is not in
+                                the configuration. Defaults to None.
+
+        Returns:
+            Variable value
+        """
+
+        if self.config.empty:
+            return default
+
+        selection = self.config['Variable'] == variable
+        if not selection.any():
+            return default
+
+        value = self.config.loc[selection, 'Value'].iloc[0]
+        if pd.isna(value):
+            return default
+
+        return value
+
+    def set_config(self, variable, value):
+        """ Sets a configuration value by variable name. The variable is
+            added to the configuration if it is not there.
+
+        Args:
+            variable (str): Variable name
+            value: Variable value
+        """
+
+        if self.config.empty:
+            self.config = pd.DataFrame(columns=['Variable', 'Value'])
+
+        selection = self.config['Variable'] == variable
+        if selection.any():
+            self.config.loc[selection, 'Value'] = value
         else:
-            print('------')
-            print('Saving data file')
-
-            for key in self._sheets.keys():
-                try:
-                    getattr(self, key).to_excel(writer,
-                                                self._sheets[key],
-                                                index=False)
-                except ValueError as ve:
-                    print(f'** {self._sheets[key]} ... couldn´t be saved')
-                    print(f'**** Error: {ve}')
-                else:
-                    print(f'-- {self._sheets[key]} ... Saved')
+            row = pd.DataFrame({'Variable': [variable], 'Value': [value]})
+            self.config = pd.concat([self.config, row], ignore_index=True)
 
-            writer.save()
-            print('------')
-            print('Data saved in file')
+    def set_storage(self, backend):
+        """ Sets the storage backend and saves all the data with it
+
+        Args:
+            backend (str): 'xlsx', 'parquet' or 'feather'
+        """
 
-    def load_students(self, csv=False, sep=";", auto_save=True):
+        if backend in storage.backends:
+            self.set_config('Storage backend', backend)
+            self.save_file()
+        else:
+            print(f'The storage backend must be one of '
+                  f'{list(storage.backends)}')
+
+    def load_students(self, csv=False, sep=";", auto_save=True, path=None):
         """ Loads student list from external file
 
         Args:
@@ -219,13 +488,15 @@ class Assignment:
             sep (str, optional): Separator for CSV files. Defaults to ";".
             auto_save (bool, optional): True for save changes automatically to
                                         XLSX file. Defaults to True.
+            path (str, optional): File path. If None it is asked with a file
+                                  dialog. Defaults to None.
         """
 
         if csv:
-            data_file = gui.csv_file()
-            self.student_list = pd.read_csv(data_file, sep)
+            data_file = gui.csv_file(path=path)
+            self.student_list = pd.read_csv(data_file, sep=sep)
         else:
-            data_file = gui.excel_file()
+            data_file = gui.excel_file(path=path)
             self.student_list = pd.read_excel(data_file)
 
         print('------')
@@ -258,34 +529,33 @@ class Assignment:
             ipywidget: ipywidget layout
         """
 
+        import ipysheet
+        import ipywidgets as w
+
         # Creates tables with legible names
-        columns = ['Variable',
-                   'Min value',
-                   'Max value',
-                   'Step',
-                   'Decimals',
-                   'Unit']
+        columns = random_variables.config_columns
 
         table = ipysheet.sheet(rows=1,
-                               columns=6,
+                               columns=len(columns),
                                column_headers=columns,
                                row_headers=False)
 
         if self.var_config.empty:
             table = ipysheet.sheet(rows=1,
-                                   columns=6,
+                                   columns=len(columns),
                                    column_headers=columns,
                                    row_headers=False)
 
-            values = ipysheet.row(0, ['V1', 0, 0, 0, 0, ''])
+            values = ipysheet.row(0, random_variables.empty_row('V1'))
         else:
             rows = len(self.var_config['Variable'])
             table = ipysheet.sheet(rows=rows,
-                                   columns=6,
+                                   columns=len(columns),
                                    column_headers=columns,
                                    row_headers=False)
 
-            values = ipysheet.cell_range(self.var_config.values.tolist(),
+            var_config = random_variables.config_frame(self.var_config)
+            values = ipysheet.cell_range(var_config.values.tolist(),
                                          row_start=0,
                                          column_start=0)
 
@@ -312,11 +582,16 @@ class Assignment:
             table (ipysheet table): ipysheet table with config data
             _ (): Dummy variable
         """
+
+        import ipysheet
+        import ipywidgets as w
+
         out = w.Output()
         with out:
             table.rows += 1
             rows_str = str(table.rows)
-            ipysheet.row(table.rows - 1, ['V' + rows_str, 0, 0, 0, 0, ''])
+            ipysheet.row(table.rows - 1,
+                         random_variables.empty_row('V' + rows_str))
 
     def generate_variable(self, low, up, step, size, decimals):
         """ Generate value for single variable
@@ -339,42 +614,302 @@ class Assignment:
         variable = variable + low
         return np.round(variable, decimals=decimals)
 
-    def generate_variables(self):
-        """ Function to generate all random variables.
+    def generate_variables(self, seed=None, max_iterations=100,
+                           unique=False):
+        """ Function to generate all random variables. All the variables of
+            all the students are drawn at once from the assignment seed
+            (configuration 'Random seed'), so the same seed and student
+            number always give the same values. The students that do not
+            meet the constraints of var_config (column 'Constraint') are
+            drawn again and the derived variables (column 'Expression') are
+            evaluated from the others. With unique no two students get the
+            same tuple of variables.
+
+        Args:
+            seed (int, optional): New assignment seed. If None the seed of
+                                  the configuration is used, or a new one
+                                  is created if there is none.
+                                  Defaults to None.
+            max_iterations (int, optional): Maximum number of times the
+                                            students that do not meet the
+                                            constraints are drawn again.
+                                            Defaults to 100.
+            unique (bool, optional): True to give a different tuple of
+                                     variables to every student.
+                                     Defaults to False.
+
+        Returns:
+            dict: iterations, draws, rejected draws, rejection rate and
+                  number of students that do not meet the constraints
         """
 
+        seed = self.random_seed(seed)
+        numbers = self.student_list['number'].to_numpy()
+
+        values, stats = random_variables.generate(self.var_config, numbers,
+                                                  seed, self.student_list,
+                                                  max_iterations, unique,
+                                                  report=True)
+
         # Student data for sheet generation
-        self.variables = pd.DataFrame(self.student_list['number'])
-        self.variables['name'] = self.student_list['name']
-
-        for i in range(len(self.var_config)):
-            self.variables[self.var_config['Variable'][i]] = \
-                self.generate_variable(self.var_config['Min value'][i],
-                                       self.var_config['Max value'][i],
-                                       self.var_config['Step'][i],
-                                       len(self.variables),
-                                       self.var_config['Decimals'][i])
+        values.insert(0, 'name', self.student_list['name'].to_numpy())
+        values.insert(0, 'number', numbers)
+        self.variables = values
+
+        print('------')
+        print(f'Variables generated (seed {seed})')
+
+        if unique or random_variables.constraints(self.var_config):
+            print(f'-- constraints ... {stats["rejection rate"]:.1%} of '
+                  f'{stats["draws"]} draws rejected '
+                  f'({stats["iterations"]} iterations)')
+
+        if stats['unsatisfied']:
+            print(f'** {stats["unsatisfied"]} students do not meet the '
+                  f'constraints (or have repeated variables) after '
+                  f'{stats["iterations"]} iterations')
+
+        self.save_file()
+
+        return stats
+
+    def regenerate_student(self, number, unique=False, max_iterations=100):
+        """ Generates again the variables of a single student with the
+            current seed. Without unique, the values are the ones
+            generate_variables() gives to the student. With unique, the
+            student gets the first of its tuples that no other student has
+            (see random_variables.generate_student), which is the one of
+            generate_variables(unique=True) unless the student had to be
+            drawn again.
+
+        Args:
+            number (int): Student number
+            unique (bool, optional): True if the variables were generated
+                                     with unique. Defaults to False.
+            max_iterations (int, optional): Maximum number of times the
+                                            student is drawn again.
+                                            Defaults to 100.
+        """
+
+        selection = self.variables['number'] == number
+        if not selection.any():
+            raise KeyError(f'Student number {number} not in variables')
+
+        student = self.student_list[self.student_list['number'] == number]
+        seed = self.random_seed()
+
+        if unique:
+            numbers = self.student_list['number'].to_numpy()
+            row = np.flatnonzero(numbers == number)[0]
+            names = random_variables.variable_grid(self.var_config)[0]
+            taken = self.variables.loc[~selection, names]
+            values = random_variables.generate_student(self.var_config,
+                                                       numbers, row, seed,
+                                                       taken, student,
+                                                       max_iterations)
+        else:
+            values = random_variables.generate(self.var_config, [number],
+                                               seed, student, max_iterations)
+
+        for column in values.columns:
+            self.variables.loc[selection, column] = values[column][0]
+
         print('------')
-        print('Variables generated')
+        print(f'Variables of student {number} generated')
 
         self.save_file()
 
-    def generate_solutions(self, solver):
+    def derive_variables(self):
+        """ Evaluates again the derived variables (column 'Expression' of
+            var_config) with the current variables and student data,
+            without drawing the others
+        """
+
+        derived = random_variables.derived_variables(self.var_config)
+        names, _, _, _, _ = random_variables.variable_grid(self.var_config)
+
+        students = self.student_list.set_index('number')
+        students = students.reindex(self.variables['number']).reset_index()
+
+        values = self.variables[names].to_numpy(dtype=float)
+        frame = random_variables.variable_frame(values, names, students,
+                                                derived)
+
+        for name, _, _ in derived:
+            self.variables[name] = frame[name].to_numpy()
+
+        print('------')
+        print(f'{len(derived)} derived variables evaluated')
+
+        self.save_file()
+
+    def random_seed(self, seed=None):
+        """ Gets the seed of the variables, stored in the configuration
+
+        Args:
+            seed (int, optional): New seed. If None the seed of the
+                                  configuration is used, or a new one is
+                                  created if there is none.
+                                  Defaults to None.
+
+        Returns:
+            int: seed
+        """
+
+        if seed is None:
+            seed = self.get_config('Random seed')
+
+        if seed is None or str(seed).strip() == '':
+            seed = random_variables.new_seed()
+
+        seed = int(float(seed))
+        self.set_config('Random seed', seed)
+
+        return seed
+
+    def generate_solutions(self, solver, batch=None, workers=1, cache=False):
         """ Uses the solver() function to generate the solution list
 
+            Two kinds of solver are accepted:
+
+            - Per student solver, solver(assignment, i), that stores the
+              solutions of the student in row i of assignment.solutions.
+            - Batch solver, solver(variables), that receives the whole
+              variables DataFrame and returns all the answers at once as a
+              DataFrame or dict with the apN columns, or as a list of arrays
+              in ap1 ... apN order.
+
+            With cache, the solutions are kept in gen/solution_cache.json
+            by solver source code and variables of each student, and the
+            solver only runs for the students whose variables changed. The
+            solver must depend only on the variables and its source code
+            (functions it calls are not checked).
+
         Args:
-            solver (function): Function to solve an individual assignment.
+            solver (function): Function to solve the assignments.
+            batch (bool, optional): True for batch solvers, False for per
+                                    student solvers. If None it is detected
+                                    from the solver arguments.
+                                    Defaults to None.
+            workers (int, optional): Number of processes used to run per
+                                     student solvers. The solver has to be
+                                     importable by the worker processes.
+                                     Defaults to 1.
+            cache (bool, optional): True to reuse the solutions of previous
+                                    runs. Defaults to False.
         """
 
-        na = self.config['Value'][6]
+        na = int(self.config['Value'][6])
         self.initialize_solutions(na)
 
-        for i in range(len(self.variables)):
-            solver(self, i)
+        if batch is None:
+            batch = is_batch_solver(solver)
+
+        rows = np.arange(len(self.variables))
+
+        if cache:
+            store = solution_cache.SolutionCache()
+            key = solution_cache.solver_key(solver, self.variables, na)
+            keys = solution_cache.variable_keys(self.variables)
+            cached = store.load(key)
+
+            hits = np.array([k in cached for k in keys], dtype=bool)
+            if hits.any():
+                found = [cached[k] for k, hit in zip(keys, hits) if hit]
+                self.solutions.iloc[rows[hits], 1:] = np.array(found,
+                                                               dtype=float)
+            rows = rows[~hits]
+
+        if batch and len(rows):
+            variables = self.variables.iloc[rows].reset_index(drop=True)
+            self.store_solutions(solver(variables), rows)
+        elif workers > 1 and len(rows):
+            self.solve_parallel(solver, workers, rows=rows)
+        elif not batch:
+            for i in rows.tolist():
+                solve_student(self, solver, i)
 
         print('------')
         print('Solutions obtained')
 
+        if cache:
+            solutions = self.solutions.iloc[:, 1:].to_numpy(dtype=float)
+            # only the current students are kept
+            store.save(key, dict(zip(keys, solutions.tolist())))
+
+            print(f'-- cache ... {int(hits.sum())} hits, '
+                  f'{len(rows)} misses')
+
+    def solve_parallel(self, solver, workers, chunks=None, rows=None):
+        """ Runs a per student solver in a pool of processes. Student rows
+            are split in contiguous chunks and the solutions of each chunk
+            are stored in self.solutions as soon as it is finished.
+
+        Args:
+            solver (function): Per student solver, solver(assignment, i).
+            workers (int): Number of processes.
+            chunks (int, optional): Number of chunks. Defaults to 4 chunks
+                                    per process.
+            rows (array, optional): Rows to solve. Defaults to all the
+                                    rows.
+        """
+
+        if rows is None:
+            rows = np.arange(len(self.variables))
+
+        n = len(rows)
+        if chunks is None:
+            chunks = 4 * workers
+
+        bounds = np.linspace(0, n, min(chunks, n) + 1).astype(int)
+        ranges = [rows[start:stop]
+                  for start, stop in zip(bounds[:-1], bounds[1:])]
+        numbers = self.variables['number'].to_numpy()
+
+        print('------')
+        print(f'Solving in {workers} processes')
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_solver_worker,
+                                 initargs=(self, solver)) as executor:
+
+            futures = {executor.submit(_solve_chunk, chunk): chunk
+                       for chunk in ranges}
+
+            for k, future in enumerate(as_completed(futures)):
+                chunk = futures[future]
+                self.solutions.iloc[chunk, 1:] = future.result()
+                print(f'-- chunk {k + 1}/{len(ranges)} ... students '
+                      f'{numbers[chunk[0]]} to {numbers[chunk[-1]]} solved')
+
+    def store_solutions(self, results, rows=None):
+        """ Stores the answers returned by a batch solver
+
+        Args:
+            results (DataFrame, dict or list): answers for all the students
+            rows (array, optional): Rows of the students solved. Defaults to
+                                    all the rows.
+        """
+
+        ap = self.solutions.columns.tolist()[1:]
+
+        if isinstance(results, (pd.DataFrame, dict)):
+            missing = [column for column in ap if column not in results]
+            if missing:
+                raise KeyError(f'Solver did not return {missing}')
+            results = [results[column] for column in ap]
+        elif len(results) != len(ap):
+            raise ValueError(f'Solver returned {len(results)} answers, '
+                             f'{len(ap)} expected')
+
+        if rows is None:
+            rows = np.arange(len(self.solutions))
+
+        for j, values in enumerate(results):
+            values = np.asarray(values, dtype=float)
+            values = np.broadcast_to(values, len(rows))
+            self.solutions.iloc[rows, j + 1] = values
+
     def initialize_solutions(self, na):
         """ Initializes the DataFrame to store solutions
 
@@ -393,7 +928,8 @@ class Assignment:
         print('------')
         print('Solutions DataFrame initialized')
 
-    def load_answers(self, date_format, sep=",", dec=".", auto=True):
+    def load_answers(self, date_format, sep=",", dec=".", auto=True,
+                     path=None):
         """ Loads students answers in a CSV format.
 
         Args:
@@ -402,9 +938,11 @@ class Assignment:
             dec (str, optional): Decimal separator. Defaults to ".".
             auto (bool, optional): True for automatic cleaning of answers.
                                    Defaults to True.
+            path (str, optional): CSV file path. If None it is asked with a
+                                  file dialog. Defaults to None.
         """
 
-        answers_file = gui.csv_file()
+        answers_file = gui.csv_file(path=path)
         self.answers = pd.read_csv(answers_file, sep=sep, decimal=dec)
         if auto:
             self.clean_answers_auto(date_format)
@@ -415,6 +953,8 @@ class Assignment:
             print('Answers loaded with no errors')
             self.save_file()
         else:
+            from IPython.display import display
+
             print('Found the following errors')
             display(errors)
             print('Answers not loaded, please fix errors and try again')
@@ -458,6 +998,9 @@ class Assignment:
             ipywidget: ipywidget layout
         """
 
+        import ipysheet
+        import ipywidgets as w
+
         ap = self.solutions.columns.tolist()
         del ap[0:1]
 
@@ -504,6 +1047,8 @@ class Assignment:
             _ (): Dummy variable
         """
 
+        import ipysheet
+
         self.grading_config = ipysheet.to_dataframe(grading_config_table)
 
         print('------')
@@ -511,7 +1056,7 @@ class Assignment:
 
         self.save_file()
 
-    def grade(self, min=0, max=10, decimals=2):
+    def grade(self, min=0, max=10, decimals=2, vectorized=True):
         """ Function to obtain students' grade
 
         Args:
@@ -519,9 +1064,36 @@ class Assignment:
             max (int, optional): Maximum grade on the scale. Defaults to 10.
             decimals (int, optional): Number of decimal on the grade.
                                       Defaults to 2.
+            vectorized (bool, optional): True to grade all questions with
+                                         NumPy arrays in a single pass, False
+                                         to use the per student loop.
+                                         Defaults to True.
         """
 
-        correct = pd.DataFrame(self.student_list[['id', 'number']])
+        if vectorized:
+            correct = self.grade_points()
+        else:
+            correct = self.grade_points_loop()
+
+        tot_points = sum(self.grading_parameters()[2])
+
+        correct.iloc[:, 2:] = correct.iloc[:, 2:].astype(float)
+        correct['points'] = correct.iloc[:, 2:].sum(axis=1)
+
+        correct['grade'] = (correct['points'] / tot_points) * (max - min) + min
+
+        correct['grade'] = np.round(correct['grade'], decimals=1)
+
+        self.grades = pd.DataFrame(correct)
+
+        self.save_file()
+
+    def grading_parameters(self):
+        """ Reads answer names, tolerances and points from grading_config
+
+        Returns:
+            tuple: answer names, tolerances (per unit) and points lists
+        """
 
         ap = self.solutions.columns.tolist()[1:]
 
@@ -530,7 +1102,57 @@ class Assignment:
 
         points = self.grading_config.iloc[1].to_list()[1:]
         points = [float(item) for item in points]
-        tot_points = sum(points)
+
+        return ap, tol, points
+
+    def grade_points(self):
+        """ Obtains the points of every student in every question.
+
+            Answers are aligned with the solutions once using the student id
+            and number, then the tolerance windows are evaluated for all
+            questions at once.
+
+        Returns:
+            DataFrame: id, number and points obtained in each question
+        """
+
+        correct = pd.DataFrame(self.student_list[['id', 'number']])
+
+        ap, tol, points = self.grading_parameters()
+        tol = np.array(tol)
+
+        # Solutions are located by position using the student number
+        student_index = correct['number'].to_numpy() - 1
+        solutions = self.solutions[ap].to_numpy(dtype=float)[student_index]
+
+        low = np.minimum(solutions * (1 - tol), solutions * (1 + tol))
+        up = np.maximum(solutions * (1 - tol), solutions * (1 + tol))
+
+        # Missing answers are aligned as NaN and never graded as correct
+        answers = self.answers.set_index('id')[ap].reindex(correct['id'])
+        answers = answers.to_numpy(dtype=float)
+
+        # Answers equal to 0 are graded as incorrect (as in the loop)
+        is_correct = (answers != 0) & (low <= answers) & (answers <= up)
+
+        points = is_correct * np.array(points)
+        for i in range(len(ap)):
+            correct[ap[i]] = points[:, i]
+
+        return correct
+
+    def grade_points_loop(self):
+        """ Obtains the points of every student in every question looping
+            over questions and students. Reference implementation of
+            grade_points().
+
+        Returns:
+            DataFrame: id, number and points obtained in each question
+        """
+
+        correct = pd.DataFrame(self.student_list[['id', 'number']])
+
+        ap, tol, points = self.grading_parameters()
 
         for i in range(len(ap)):
 
@@ -551,7 +1173,8 @@ class Assignment:
 
                 answer = self.answers[self.answers.id == student][ap[i]].values
 
-                if answer:
+                # no answer row (or an answer of 0) is not correct
+                if answer.size and answer[0] != 0:
                     low_value = low.iloc[student_index]
                     up_value = up.iloc[student_index]
                     is_correct.append((low_value <= answer <= up_value)[0])
@@ -561,16 +1184,7 @@ class Assignment:
             is_correct = np.array(is_correct)
             correct[ap[i]] = is_correct * points[i]
 
-        correct.iloc[:, 2:] = correct.iloc[:, 2:].astype(float)
-        correct['points'] = correct.iloc[:, 2:].sum(axis=1)
-
-        correct['grade'] = (correct['points'] / tot_points) * (max - min) + min
-
-        correct['grade'] = np.round(correct['grade'], decimals=1)
-
-        self.grades = pd.DataFrame(correct)
-
-        self.save_file()
+        return correct
 
     def get_id_string(self):
         """ Gets a regex  with the student list separated with |
@@ -585,6 +1199,8 @@ class Assignment:
         """ Copies regex with IDs to the clipboard
         """
 
+        import pyperclip
+
         id_string = self.get_id_string()
         pyperclip.copy(id_string)
         print('String copied to clipboard')
@@ -598,7 +1214,7 @@ class Assignment:
 
         try:
             na = int(na)
-            self.config['Value'][6] = na
+            self.config.loc[6, 'Value'] = na
             self.save_file()
         except ValueError:
             print('The number of answers must be an integer')
@@ -612,7 +1228,7 @@ class Assignment:
 
         try:
             ns = int(ns)
-            self.config['Value'][7] = ns
+            self.config.loc[7, 'Value'] = ns
             self.save_file()
         except ValueError:
             print('The number of sheets must be an integer')
@@ -624,7 +1240,7 @@ class Assignment:
             password (str): password for the sheets
         """
 
-        self.config['Value'][8] = password
+        self.config.loc[8, 'Value'] = password
         self.save_file()
 
     def check_answers(self):
@@ -644,3 +1260,75 @@ class Assignment:
         check_df['check'] = check_df['number'] == check_df['number_st']
 
         return check_df[check_df['check'] == False]
+
+
+def is_batch_solver(solver):
+    """ Checks if a solver is a batch solver, solver(variables), or a per
+        student solver, solver(assignment, i)
+
+    Args:
+        solver (function): Solver function
+
+    Returns:
+        bool: True if the solver takes a single required argument
+    """
+
+    parameters = inspect.signature(solver).parameters.values()
+    kinds = (inspect.Parameter.POSITIONAL_ONLY,
+             inspect.Parameter.POSITIONAL_OR_KEYWORD)
+    required = [p for p in parameters
+                if p.kind in kinds and p.default is inspect.Parameter.empty]
+
+    return len(required) == 1
+
+
+def solve_student(assignment, solver, i):
+    """ Runs a per student solver for row i naming the student number if
+        the solver fails
+
+    Args:
+        assignment (Assignment): Assignment object
+        solver (function): Per student solver, solver(assignment, i).
+        i (int): Student row
+    """
+
+    try:
+        solver(assignment, i)
+    except Exception as e:
+        number = assignment.variables['number'][i]
+        raise RuntimeError(f'Solver failed for student number {number}: '
+                           f'{e!r}') from e
+
+
+# Assignment and solver of each solver process
+_worker = {}
+
+
+def _init_solver_worker(assignment, solver):
+    """ Stores the assignment and the solver in a solver process
+
+    Args:
+        assignment (Assignment): Assignment object
+        solver (function): Per student solver, solver(assignment, i).
+    """
+
+    _worker['assignment'] = assignment
+    _worker['solver'] = solver
+
+
+def _solve_chunk(rows):
+    """ Solves a chunk of students in a solver process
+
+    Args:
+        rows (array): Rows of the students
+
+    Returns:
+        ndarray: solutions of the rows (without the number column)
+    """
+
+    assignment = _worker['assignment']
+
+    for i in rows.tolist():
+        solve_student(assignment, _worker['solver'], i)
+
+    return assignment.solutions.iloc[rows, 1:].to_numpy()
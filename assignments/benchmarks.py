@@ -0,0 +1,385 @@
+import pandas as pd
+import numpy as np
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from PyPDF2 import PdfFileWriter
+from PyPDF2.generic import NameObject, StreamObject
+from .assignment import Assignment
+from . import generate_pdf
+from . import office_365_mail
+from . import random_variables
+from . import templates
+
+
+def synthetic_assignment(n, na=5, seed=0):
+    """ Creates an assignment with random students, solutions, answers and
+        grading configuration. Nothing is saved to disk.
+
+    Args:
+        n (int): Number of students.
+        na (int, optional): Number of answers per student. Defaults to 5.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        Assignment: Assignment object with synthetic data
+    """
+
+    rng = np.random.default_rng(seed)
+
+    assignment = Assignment()
+
+    numbers = np.arange(1, n + 1)
+    ids = 10000000 + numbers
+    assignment.student_list = pd.DataFrame({'number': numbers,
+                                            'id': ids,
+                                            'name': 'Student',
+                                            'email': 'student@mail.com'})
+
+    ap = ['ap' + str(i + 1) for i in range(na)]
+
+    solutions = rng.uniform(-100, 100, size=(n, na))
+    assignment.solutions = pd.DataFrame(solutions, columns=ap)
+    assignment.solutions.insert(0, 'number', numbers)
+
+    # Answers are a mix of correct, wrong and missing values and some
+    # students do not answer at all
+    noise = rng.choice([1, 1.001, 1.1, np.nan], size=(n, na))
+    answered = rng.random(n) < 0.9
+    answers = pd.DataFrame(solutions * noise, columns=ap)
+    answers.insert(0, 'number', numbers)
+    answers.insert(0, 'id', ids)
+    assignment.answers = answers[answered].sample(frac=1, random_state=seed)
+
+    grading_config = [['Tolerance (%)'] + [1] * na,
+                      ['Points'] + [1] * na]
+    assignment.grading_config = pd.DataFrame(grading_config,
+                                             columns=['Variable'] + ap)
+
+    config = [['Greeting', 'Hello'],
+              ['Assignment name', 'Assignment'],
+              ['Assignment code', 'A1'],
+              ['Course name', 'Course'],
+              ['Course code', 'C1'],
+              ['Professor name', 'Professor'],
+              ['Number of questions', na],
+              ['Number of sheets', 1],
+              ['Password', ''],
+              ['Storage backend', 'xlsx']]
+    assignment.config = pd.DataFrame(config, columns=['Variable', 'Value'])
+
+    return assignment
+
+
+def benchmark_grade(sizes=(100, 1000, 10000), na=5):
+    """ Compares the vectorized grading engine with the per student loop
+
+    Args:
+        sizes (tuple, optional): Number of students of each run.
+                                 Defaults to (100, 1000, 10000).
+        na (int, optional): Number of answers per student. Defaults to 5.
+
+    Returns:
+        DataFrame: Execution time of both implementations for each size
+    """
+
+    results = []
+
+    for n in sizes:
+        assignment = synthetic_assignment(n, na)
+
+        start = time.perf_counter()
+        vectorized = assignment.grade_points()
+        vectorized_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loop = assignment.grade_points_loop()
+        loop_time = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(vectorized, loop)
+
+        results.append({'students': n,
+                        'loop (s)': loop_time,
+                        'vectorized (s)': vectorized_time,
+                        'speedup': loop_time / vectorized_time})
+
+        print(f'-- {n} students ... loop {loop_time:.3f} s, '
+              f'vectorized {vectorized_time:.3f} s')
+
+    return pd.DataFrame(results)
+
+
+def benchmark_email_body(n=10000):
+    """ Compares the email body generation with the template loaded once
+        per run (as send_email_list() does) and with the per message file
+        read and replace loop
+
+    Args:
+        n (int, optional): Number of students. Defaults to 10000.
+
+    Returns:
+        DataFrame: Execution time of both implementations
+    """
+
+    assignment = synthetic_assignment(n)
+    names = [f'Student {i}' for i in range(n)]
+
+    start = time.perf_counter()
+    replace = [office_365_mail.generate_body_replace(name, assignment)
+               for name in names]
+    replace_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loaded = templates.load_template(office_365_mail.email_template,
+                                     assignment)
+    template = [office_365_mail.generate_body(name, assignment, loaded)
+                for name in names]
+    template_time = time.perf_counter() - start
+
+    assert replace == template
+
+    print(f'-- {n} bodies ... replace {replace_time:.3f} s, '
+          f'template {template_time:.3f} s')
+
+    return pd.DataFrame([{'students': n,
+                          'replace (s)': replace_time,
+                          'template (s)': template_time,
+                          'speedup': replace_time / template_time}])
+
+
+def synthetic_var_config(nv=10):
+    """ Creates a variable configuration with integer and decimal variables
+
+    Args:
+        nv (int, optional): Number of variables. Defaults to 10.
+
+    Returns:
+        DataFrame: variable configuration
+    """
+
+    rows = [['V' + str(i + 1), 1.0, 10.0 * (i + 1), 0.5, 1, '']
+            for i in range(nv)]
+
+    return pd.DataFrame(rows, columns=['Variable', 'Min value', 'Max value',
+                                       'Step', 'Decimals', 'Unit'])
+
+
+def benchmark_variables(sizes=(1000, 10000, 100000), nv=10):
+    """ Compares the variable generation drawing every variable with a
+        separate call to the global random state and drawing all of them
+        at once from the seed
+
+    Args:
+        sizes (tuple, optional): Number of students of each run.
+                                 Defaults to (1000, 10000, 100000).
+        nv (int, optional): Number of variables. Defaults to 10.
+
+    Returns:
+        DataFrame: Execution time of both implementations for each size
+    """
+
+    results = []
+    var_config = synthetic_var_config(nv)
+    assignment = Assignment()
+
+    for n in sizes:
+        numbers = np.arange(1, n + 1)
+
+        start = time.perf_counter()
+        variables = pd.DataFrame({'number': numbers})
+        for i in range(nv):
+            variables[var_config['Variable'][i]] = \
+                assignment.generate_variable(var_config['Min value'][i],
+                                             var_config['Max value'][i],
+                                             var_config['Step'][i],
+                                             n,
+                                             var_config['Decimals'][i])
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        random_variables.generate(var_config, numbers, seed=0)
+        batch_time = time.perf_counter() - start
+
+        results.append({'students': n,
+                        'loop (s)': loop_time,
+                        'batch (s)': batch_time,
+                        'speedup': loop_time / batch_time})
+
+        print(f'-- {n} students ... loop {loop_time:.3f} s, '
+              f'batch {batch_time:.3f} s')
+
+    return pd.DataFrame(results)
+
+
+def synthetic_pdf(path, pages, size=4096):
+    """ Creates a PDF with a text content stream on each page, as a merged
+        sheet file
+
+    Args:
+        path (str): PDF file path.
+        pages (int): Number of pages.
+        size (int, optional): Bytes of content of each page.
+                              Defaults to 4096.
+    """
+
+    pdf_writer = PdfFileWriter()
+
+    for i in range(pages):
+        page = pdf_writer.addBlankPage(595, 842)
+        text = f'BT /F1 12 Tf 72 720 Td (Page {i + 1}) Tj ET\n'
+        content = StreamObject()
+        content._data = (text + '%' * size + '\n').encode()
+        page[NameObject('/Contents')] = pdf_writer._addObject(content)
+
+    with open(path, 'wb') as out:
+        pdf_writer.write(out)
+
+
+class _Progress:
+    value = 0.0
+
+
+def split_peak(assignment, pdf_file, n, window=None, password='password'):
+    """ Measures the peak memory of split_pdf()
+
+    Args:
+        assignment (Assignment): Assignment object.
+        pdf_file (str): Original pdf file.
+        n (int): Pages per student.
+        window (int, optional): Students per window. Defaults to None.
+        password (str or bool, optional): Password to encrypt documents.
+                                          Defaults to 'password'.
+
+    Returns:
+        float: Peak memory (MB)
+    """
+
+    tracemalloc.start()
+    try:
+        generate_pdf.split_pdf(assignment, pdf_file, n, password,
+                               _Progress(), window=window)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_split_memory(sizes=(100, 200, 400), n=3, window=50):
+    """ Measures the peak memory of split_pdf() keeping the whole file and
+        reading it in windows of students. The peak of the windowed split
+        should stay roughly flat, as the tests check with small files.
+
+    Args:
+        sizes (tuple, optional): Number of students of each run.
+                                 Defaults to (100, 200, 400).
+        n (int, optional): Pages per student. Defaults to 3.
+        window (int, optional): Students per window. Defaults to 50.
+
+    Returns:
+        DataFrame: Peak memory (MB) of both modes for each size
+    """
+
+    results = []
+    cwd = os.getcwd()
+
+    # split_pdf() writes its manifest in gen/ of the working directory
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        os.mkdir('gen')
+
+        try:
+            for total in sizes:
+                synthetic_pdf('sheets.pdf', total * n)
+
+                assignment = Assignment()
+                files = [f'{i}.pdf' for i in range(total)]
+                assignment.student_list = pd.DataFrame({'file': files})
+
+                peaks = {mode: split_peak(assignment, 'sheets.pdf', n, size)
+                         for mode, size in (('whole', None),
+                                            ('window', window))}
+
+                results.append({'students': total,
+                                'whole (MB)': peaks['whole'],
+                                'window (MB)': peaks['window']})
+
+                print(f'-- {total} students ... '
+                      f'whole {peaks["whole"]:.1f} MB, '
+                      f'window {peaks["window"]:.1f} MB')
+        finally:
+            os.chdir(cwd)
+
+    return pd.DataFrame(results)
+
+
+# Modules of the package and optional dependencies that only the functions
+# that use them may import
+import_modules = ('assignments.assignment',
+                  'assignments.generate_pdf',
+                  'assignments.render_pdf',
+                  'assignments.office_365_mail')
+deferred_modules = ('PyQt5', 'ipysheet', 'ipywidgets', 'IPython',
+                    'pyperclip', 'O365')
+
+
+def benchmark_import(modules=import_modules, runs=3):
+    """ Measures the import time of each module in a new interpreter with
+        -X importtime and checks that no GUI, clipboard or O365 dependency
+        is imported with it
+
+    Args:
+        modules (tuple, optional): Modules to import.
+                                   Defaults to import_modules.
+        runs (int, optional): Imports of each module (the fastest one is
+                              kept). Defaults to 3.
+
+    Returns:
+        DataFrame: Import time (s) of each module and the dependencies of
+                   the package it imports
+    """
+
+    results = []
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    for module in modules:
+        times = []
+
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-X', 'importtime',
+                                     '-c', f'import {module}'],
+                                    cwd=package, capture_output=True,
+                                    text=True, check=True).stderr
+
+            # import time: self [us] | cumulative | imported package
+            imported = {}
+            for line in output.splitlines():
+                if not line.startswith('import time:'):
+                    continue
+                fields = line[len('import time:'):].split('|')
+                if not fields[1].strip().isdigit():
+                    continue
+                imported[fields[2].strip()] = int(fields[1])
+
+            times.append(imported[module] / 1e6)
+
+        loaded = sorted(name for name in imported
+                        if name.split('.')[0] in deferred_modules)
+        top = {name.split('.')[0] for name in imported}
+
+        results.append({'module': module,
+                        'import (s)': min(times),
+                        'pandas': 'pandas' in top,
+                        'PyPDF2': 'PyPDF2' in top,
+                        'deferred imported': ', '.join(loaded)})
+
+        print(f'-- {module} ... {min(times):.3f} s')
+
+    results = pd.DataFrame(results)
+
+    failed = results[results['deferred imported'] != '']
+    assert failed.empty, \
+        f'Deferred modules imported: {failed.to_dict("records")}'
+
+    return results
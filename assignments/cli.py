@@ -0,0 +1,398 @@
+import argparse
+import contextlib
+import importlib
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import gui
+
+
+def load_students(assignment, args):
+    """ Loads the student list (notebook 01)
+
+    Args:
+        assignment (Assignment): Assignment object.
+        args (Namespace): Command line arguments.
+    """
+
+    assignment.load_students(csv=args.csv, sep=args.sep, path=args.path)
+
+
+def generate_variables(assignment, args):
+    """ Generates the random variables (notebook 01)
+
+    Args:
+        assignment (Assignment): Assignment object.
+        args (Namespace): Command line arguments.
+    """
+
+    assignment.generate_variables(seed=args.seed,
+                                  max_iterations=args.max_iterations,
+                                  unique=args.unique)
+
+
+def solve(assignment, args):
+    """ Generates the solutions with a solver function (notebook 02)
+
+    Args:
+        assignment (Assignment): Assignment object.
+        args (Namespace): Command line arguments.
+    """
+
+    assignment.generate_solutions(load_solver(args.solver),
+                                  workers=args.workers, cache=args.cache)
+    assignment.save_file()
+
+
+def split_pdfs(assignment, args):
+    """ Splits the file with all the sheets in one file per student
+        (notebook 03)
+
+    Args:
+        assignment (Assignment): Assignment object.
+        args (Namespace): Command line arguments.
+    """
+
+    from . import generate_pdf
+
+    generate_pdf.create_pdfs(assignment, workers=args.workers,
+                             window=args.window,
+                             incremental=args.incremental,
+                             pdf_file=args.path)
+
+
+def send(assignment, args):
+    """ Sends the assignment to the students (notebook 04)
+
+    Args:
+        assignment (Assignment): Assignment object.
+        args (Namespace): Command line arguments.
+    """
+
+    from . import office_365_mail
+
+    account = login(args.credentials)
+    sent = office_365_mail.send_email_list(account, assignment,
+                                           args.max_in_flight, args.rate,
+                                           args.retries,
+                                           resume=not args.no_resume)
+    if not all(sent):
+        raise RuntimeError(f'{sent.count(False)} emails not sent')
+
+
+def grade(assignment, args):
+    """ Loads the answers and grades them (notebook 05)
+
+    Args:
+        assignment (Assignment): Assignment object.
+        args (Namespace): Command line arguments.
+    """
+
+    assignment.load_answers(args.date_format, sep=args.sep, dec=args.dec,
+                            path=args.path)
+    if assignment.answers.empty:
+        raise ValueError('Answers not loaded')
+
+    assignment.grade(min=args.min, max=args.max, decimals=args.decimals)
+
+
+def send_grades(assignment, args):
+    """ Sends the grades to the students (notebook 06)
+
+    Args:
+        assignment (Assignment): Assignment object.
+        args (Namespace): Command line arguments.
+    """
+
+    from . import office_365_mail
+
+    account = login(args.credentials)
+    sent = office_365_mail.send_grade_list(account, assignment, args.titles,
+                                           args.max_in_flight, args.rate,
+                                           args.retries,
+                                           resume=not args.no_resume)
+    if not all(sent):
+        raise RuntimeError(f'{sent.count(False)} emails not sent')
+
+
+# Function of each subcommand
+stages = {'load-students': load_students,
+          'generate-variables': generate_variables,
+          'solve': solve,
+          'split-pdfs': split_pdfs,
+          'send': send,
+          'grade': grade,
+          'send-grades': send_grades}
+
+
+def load_solver(name):
+    """ Imports a solver function given as module path. The assignment
+        directory is searched first.
+
+    Args:
+        name (str): 'module.path:function' or 'module.path' for a function
+                    named solver
+
+    Returns:
+        function: solver function
+    """
+
+    module, _, function = name.partition(':')
+
+    return getattr(importlib.import_module(module), function or 'solver')
+
+
+def login(path):
+    """ Logs in Office 365 with the credentials of a JSON file
+
+    Args:
+        path (str): Credentials file path
+
+    Returns:
+        Account: Azure app handler
+    """
+
+    from . import office_365_mail
+
+    credentials = office_365_mail.load_credentials(path)
+    if credentials is None:
+        raise FileNotFoundError(path)
+
+    return office_365_mail.o365_login(credentials['id_app'],
+                                      credentials['secret'])
+
+
+def run_stage(directory, args, log=None):
+    """ Runs a stage in an assignment directory (the paths of the assignment
+        are relative to it)
+
+    Args:
+        directory (str): Assignment directory
+        args (Namespace): Command line arguments
+        log (str, optional): File, relative to the directory, where the
+                             output of the stage is appended. If None it is
+                             printed. Defaults to None.
+
+    Returns:
+        dict: directory, stage, status, time (s) and error
+    """
+
+    from .assignment import Assignment
+
+    gui.set_headless()
+
+    cwd = os.getcwd()
+    result = {'directory': directory, 'stage': args.command,
+              'status': 'failed', 'error': ''}
+    start = time.perf_counter()
+
+    try:
+        os.chdir(directory)
+    except OSError as e:
+        result['error'] = repr(e)
+        result['time (s)'] = 0.0
+        return result
+
+    path = os.getcwd()
+    modules = set(sys.modules)
+    sys.path.insert(0, path)
+
+    try:
+        with contextlib.ExitStack() as stack:
+            if log is not None:
+                out = stack.enter_context(open(log, 'a'))
+                stack.enter_context(contextlib.redirect_stdout(out))
+                stack.enter_context(contextlib.redirect_stderr(out))
+                print(f'------ {time.ctime()} {args.command}')
+
+            try:
+                stages[args.command](Assignment(True), args)
+                result['status'] = 'ok'
+            except Exception as e:
+                traceback.print_exc()
+                result['error'] = repr(e)
+    finally:
+        sys.path.remove(path)
+        os.chdir(cwd)
+
+        # forgets the modules of the directory (e.g. the solver), so other
+        # directories import their own
+        for name in set(sys.modules) - modules:
+            if name.split('.')[0] == __package__:
+                continue
+            module_file = getattr(sys.modules[name], '__file__', None) or ''
+            if os.path.abspath(module_file).startswith(path + os.sep):
+                del sys.modules[name]
+
+    result['time (s)'] = time.perf_counter() - start
+
+    return result
+
+
+def run(args):
+    """ Runs a stage in every directory, in a pool of processes if
+        args.jobs > 1. With several processes the output of each directory
+        is written to its gen/cli.log.
+
+    Args:
+        args (Namespace): Command line arguments
+
+    Returns:
+        [dict]: result of each directory, in the order they were given
+    """
+
+    directories = args.directories
+
+    if args.jobs > 1 and len(directories) > 1:
+        log = os.path.join('gen', 'cli.log')
+        results = {}
+
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+
+            futures = {executor.submit(run_stage, directory, args, log):
+                       directory for directory in directories}
+
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                print(f'-- {result["directory"]} ... {result["status"]} '
+                      f'({result["time (s)"]:.2f} s)')
+
+        return [results[directory] for directory in directories]
+
+    return [run_stage(directory, args) for directory in directories]
+
+
+def positive(value):
+    """ Parses a positive number of the command line
+
+    Args:
+        value (str): Argument value
+
+    Returns:
+        float: number
+    """
+
+    try:
+        number = float(value)
+    except ValueError:
+        number = float('nan')
+
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive number')
+
+    return number
+
+
+def parser():
+    """ Creates the command line parser
+
+    Returns:
+        ArgumentParser: parser with a subcommand for each stage
+    """
+
+    main_parser = argparse.ArgumentParser(
+        prog='python -m assignments',
+        description='Runs a stage of the assignment pipeline (notebooks 01 '
+                    'to 06) without GUI in one or more assignment '
+                    'directories.')
+    subparsers = main_parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-d', '--directories', nargs='+', default=['.'],
+                        metavar='DIR',
+                        help='assignment directories (default: .)')
+    common.add_argument('-j', '--jobs', type=int, default=1,
+                        help='directories processed at the same time')
+
+    mail = argparse.ArgumentParser(add_help=False)
+    mail.add_argument('--credentials', default='resources/credentials.json')
+    mail.add_argument('--max-in-flight', type=int, default=4)
+    mail.add_argument('--rate', type=positive, default=4,
+                      help='emails per second')
+    mail.add_argument('--retries', type=int, default=5)
+    mail.add_argument('--no-resume', action='store_true',
+                      help='send again to the students in the send journal')
+
+    command = subparsers.add_parser('load-students', parents=[common],
+                                    help='load the student list')
+    command.add_argument('path', help='XLSX file (or CSV with --csv)')
+    command.add_argument('--csv', action='store_true')
+    command.add_argument('--sep', default=';')
+
+    command = subparsers.add_parser('generate-variables', parents=[common],
+                                    help='generate the random variables')
+    command.add_argument('--seed', type=int, default=None,
+                         help='new assignment seed (default: the seed of '
+                              'the configuration)')
+    command.add_argument('--unique', action='store_true',
+                         help='give a different tuple of variables to '
+                              'every student')
+    command.add_argument('--max-iterations', type=int, default=100,
+                         help='times the students that do not meet the '
+                              'constraints are drawn again')
+
+    command = subparsers.add_parser('solve', parents=[common],
+                                    help='generate the solutions')
+    command.add_argument('solver',
+                         help="solver as 'module.path:function' (the "
+                              "function name defaults to solver)")
+    command.add_argument('--workers', type=int, default=1,
+                         help='processes for per student solvers')
+    command.add_argument('--cache', action='store_true',
+                         help='reuse the solutions of students whose '
+                              'variables did not change')
+
+    command = subparsers.add_parser('split-pdfs', parents=[common],
+                                    help='split the file with all sheets')
+    command.add_argument('path', help='PDF file with all the sheets')
+    command.add_argument('--workers', type=int, default=1)
+    command.add_argument('--window', type=int, default=None)
+    command.add_argument('--incremental', action='store_true')
+
+    subparsers.add_parser('send', parents=[common, mail],
+                          help='send the assignments by email')
+
+    command = subparsers.add_parser('grade', parents=[common],
+                                    help='load the answers and grade them')
+    command.add_argument('path', help='CSV file with the answers')
+    command.add_argument('--date-format', default='%d/%m/%Y %H:%M:%S')
+    command.add_argument('--sep', default=',')
+    command.add_argument('--dec', default='.')
+    command.add_argument('--min', type=float, default=0)
+    command.add_argument('--max', type=float, default=10)
+    command.add_argument('--decimals', type=int, default=2)
+
+    command = subparsers.add_parser('send-grades', parents=[common, mail],
+                                    help='send the grades by email')
+    command.add_argument('--titles', nargs=3,
+                         default=['Respuestas', 'Soluciones', 'Puntos'],
+                         help='headers of the grading table')
+
+    return main_parser
+
+
+def main(argv=None):
+    """ Command line entry point. Prints the time of the stage in each
+        directory.
+
+    Args:
+        argv ([str], optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: exit status, 1 if the stage failed in any directory
+    """
+
+    args = parser().parse_args(argv)
+    results = run(args)
+
+    print('------')
+    for result in results:
+        print(f'{result["directory"]} | {result["stage"]} | '
+              f'{result["status"]} | {result["time (s)"]:.2f} s')
+        if result['error']:
+            print(f'**** Error: {result["error"]}')
+
+    return int(any(result['status'] != 'ok' for result in results))
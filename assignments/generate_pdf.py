@@ -1,18 +1,40 @@
 from PyPDF2 import PdfFileWriter, PdfFileReader
-from IPython.display import display
-import ipywidgets as widgets
+from PyPDF2.generic import (ArrayObject, ByteStringObject, DictionaryObject,
+                            NameObject, NumberObject)
+# private PyPDF2 1.26 functions used by encrypt()
+from PyPDF2.pdf import PageObject, _alg33, _alg35
+import numpy as np
+import gc
+import hashlib
+import io
+import json
 import threading
 import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from . import gui
+from . import storage
 
 
-def create_pdfs(assignment):
+def create_pdfs(assignment, workers=1, window=None, incremental=False,
+                pdf_file=None):
     """ Creates individual PDF files from a file with all sheets.
-        Ask for the original file using a file dialog
+        Ask for the original file using a file dialog if it is not given.
+        In headless mode (see gui.set_headless) the files are created before
+        returning, without progress widget.
 
     Args:
         assignment (Assignment): Assignment object.
+        workers (int, optional): Number of processes used to split and
+                                 encrypt the files. Defaults to 1.
+        window (int, optional): Number of students read at a time to keep
+                                memory use bounded for large files. If None
+                                the whole file is kept. Defaults to None.
+        incremental (bool, optional): True to write only the sheets that
+                                      changed since the last run instead of
+                                      emptying the sheets folder.
+                                      Defaults to False.
+        pdf_file (str, optional): File with all sheets. Defaults to None.
     """
 
     # number of pages per sheet
@@ -22,36 +44,41 @@ def create_pdfs(assignment):
     password = assignment.config['Value'][8]
 
     # removes sheet folder contents
-    for sheet in os.listdir('sheets'):
-        sheet_file = os.path.join('sheets', sheet)
-        try:
-            if os.path.isfile(sheet_file) or os.path.islink(sheet_file):
-                os.unlink(sheet_file)
-            elif os.path.isdir(sheet_file):
-                shutil.rmtree(sheet_file)
-        except Exception as e:
-            print('Failed to delete %s. Reason: %s' % (sheet_file, e))
+    if not incremental:
+        for sheet in os.listdir('sheets'):
+            sheet_file = os.path.join('sheets', sheet)
+            try:
+                if os.path.isfile(sheet_file) or os.path.islink(sheet_file):
+                    os.unlink(sheet_file)
+                elif os.path.isdir(sheet_file):
+                    shutil.rmtree(sheet_file)
+            except Exception as e:
+                print('Failed to delete %s. Reason: %s' % (sheet_file, e))
 
     # sets the password to False if it is empty
     if password.isspace() or (not password):
         password = False
 
     # opens dialog to ask for original file
-    pdf_file = gui.pdf_file()
+    pdf_file = gui.pdf_file(path=pdf_file)
 
     print('------')
     print("Creating files")
 
     # creates pdf and show progress bar in Jupyter
-    progress = widgets.FloatProgress(value=0.0, min=0.0, max=1.0)
-    thread = threading.Thread(target=split_pdf,
-                              args=(assignment,
-                                    pdf_file, n, password, progress))
-    display(progress)
-    thread.start()
+    progress = gui.progress_bar()
+    args = (assignment, pdf_file, n, password, progress, workers, window,
+            incremental)
 
+    if gui.headless:
+        split_pdf(*args)
+    else:
+        thread = threading.Thread(target=split_pdf, args=args)
+        thread.start()
 
-def split_pdf(assignment, pdf_file, n, password, progress):
+
+def split_pdf(assignment, pdf_file, n, password, progress, workers=1,
+              window=None, incremental=False):
     """ Splits pdf in multiple files giving the number of pages per document.
 
     Args:
@@ -61,33 +88,520 @@ def split_pdf(assignment, pdf_file, n, password, progress):
         password (str or bool): Password to encrypt documents. If set to false
                                 documents are no encrypted.
         progress (widget): Progress bar ipywidget
+        workers (int, optional): Number of processes. Each process opens the
+                                 original file once and writes contiguous
+                                 ranges of students. Defaults to 1.
+        window (int, optional): Number of students read at a time. The
+                                pages parsed in a window are released
+                                before the next one, so memory use does not
+                                grow with the number of students. If None
+                                the whole file is kept. Defaults to None.
+        incremental (bool, optional): True to write only the documents whose
+                                      pages, number of pages or password
+                                      changed since the last run (see
+                                      SheetManifest) or whose file is
+                                      missing. Files of students no longer
+                                      in the list are removed. Both modes
+                                      save the manifest of the documents.
+                                      Defaults to False.
 
     Returns:
         [bool]: Returns True if the execution is successful.
     """
-    data = assignment.student_list
+    files = assignment.student_list['file'].to_list()
+    rows = list(range(len(files)))
+    manifest = SheetManifest()
+
+    if incremental:
+        hashes = sheet_hashes(pdf_file, len(files), n, window)
+        entries = {file: manifest.entry(content, n, password)
+                   for file, content in zip(files, hashes)}
+        rows = manifest.changed(files, entries)
+        removed = manifest.remove_stale(files)
 
-    pdf = PdfFileReader(pdf_file)
-    total = len(data)
+        print(f'-- {len(rows)} of {len(files)} sheets changed, '
+              f'{removed} old sheets removed')
+    else:
+        # the sheets are replaced: an interrupted run must not leave the
+        # entries of the previous ones
+        manifest.clear()
 
-    # creates individual documents
-    for i in range(total):
-        pdf_writer = PdfFileWriter()
-        output_file = data['file'][i]
+    hashes = {}
 
-        for j in range(n):
-            pdf_writer.addPage(pdf.getPage(n * i + j))
+    if not rows:
+        progress.value = 1.0
+    elif workers > 1:
+        hashes = split_parallel(pdf_file, files, rows, n, password, progress,
+                                workers, window)
+    elif window:
+        hashes = split_windows(pdf_file, files, rows, n, password, progress,
+                               window)
+    else:
+        pdf = PdfFileReader(pdf_file)
 
-        if password:
-            pdf_writer.encrypt(user_pwd=password,
-                               owner_pwd=None,
-                               use_128bit=True)
+        # creates individual documents
+        for k, i in enumerate(rows):
+            hashes[i] = write_sheet(pdf, i, n, password, files[i])
+            progress.value = float(k + 1) / len(rows)
 
-        with open(output_file, 'wb') as out:
-            pdf_writer.write(out)
+    if not incremental:
+        entries = {files[i]: manifest.entry(content, n, password)
+                   for i, content in hashes.items()}
 
-        progress.value = float(i + 1) / total
+    manifest.save(entries)
 
     print("Files created")
 
     return True
+
+
+def split_windows(pdf_file, files, rows, n, password, progress, window):
+    """ Writes the individual documents reading the original file in windows
+        of students. The file is read from disk as needed (not loaded in
+        memory) and the objects parsed in a window are released after it.
+
+    Args:
+        pdf_file (str): Original pdf file.
+        files ([str]): Output file of each student.
+        rows ([int]): Rows of the students to write.
+        n (int): Number of pages per document.
+        password (str or bool): Password to encrypt documents.
+        progress (widget): Progress bar ipywidget
+        window (int): Number of students per window.
+
+    Returns:
+        dict: hash of the pages (see sheet_hash) by student row
+    """
+
+    total = len(rows)
+    hashes = {}
+
+    with open(pdf_file, 'rb') as stream:
+        pdf = PdfFileReader(stream)
+
+        for start in range(0, total, window):
+            for k in range(start, min(start + window, total)):
+                i = rows[k]
+                hashes[i] = write_sheet(pdf, i, n, password, files[i])
+                progress.value = float(k + 1) / total
+
+            release_pages(pdf)
+
+    return hashes
+
+
+def release_pages(pdf):
+    """ Drops the objects cached by a reader. The pages keep references to
+        the reader (reference cycles), so they are released when the
+        garbage is collected.
+
+    Args:
+        pdf (PdfFileReader): Original pdf.
+    """
+
+    pdf.resolvedObjects.clear()
+    gc.collect()
+
+
+def split_parallel(pdf_file, files, rows, n, password, progress, workers,
+                   window=None, chunks=None):
+    """ Writes the individual documents in a pool of processes. Students are
+        split in contiguous chunks and the progress bar is updated as the
+        chunks are finished.
+
+    Args:
+        pdf_file (str): Original pdf file.
+        files ([str]): Output file of each student.
+        rows ([int]): Rows of the students to write.
+        n (int): Number of pages per document.
+        password (str or bool): Password to encrypt documents.
+        progress (widget): Progress bar ipywidget
+        workers (int): Number of processes.
+        window (int, optional): Number of students per chunk. The objects
+                                parsed in a chunk are released after it, as
+                                in split_windows(). Defaults to None.
+        chunks (int, optional): Number of chunks if there is no window.
+                                Defaults to 4 chunks per process.
+
+    Returns:
+        dict: hash of the pages (see sheet_hash) by student row
+    """
+
+    total = len(rows)
+    if window:
+        chunks = -(-total // window)
+    elif chunks is None:
+        chunks = 4 * workers
+
+    bounds = np.linspace(0, total, min(chunks, total) + 1).astype(int)
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+
+    hashes = {}
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_split_worker,
+                             initargs=(pdf_file, n, password,
+                                       window)) as executor:
+
+        futures = []
+        for start, stop in ranges:
+            chunk = rows[start:stop]
+            futures.append(executor.submit(_split_chunk, chunk,
+                                           [files[i] for i in chunk]))
+
+        for future in as_completed(futures):
+            hashes.update(future.result())
+            progress.value = float(len(hashes)) / total
+
+    return hashes
+
+
+def sheet_hashes(pdf_file, total, n, window=None):
+    """ Computes the content hash of the pages of every student
+
+    Args:
+        pdf_file (str): Original pdf file.
+        total (int): Number of students.
+        n (int): Number of pages per document.
+        window (int, optional): Number of students read at a time (see
+                                split_windows()). Defaults to None.
+
+    Returns:
+        [str]: hash of each student
+    """
+
+    hashes = []
+
+    with open(pdf_file, 'rb') as stream:
+        pdf = PdfFileReader(stream)
+
+        for i in range(total):
+            hashes.append(sheet_hash(pdf, i, n))
+
+            if window and (i + 1) % window == 0:
+                release_pages(pdf)
+
+    return hashes
+
+
+def sheet_hash(pdf, i, n):
+    """ Computes a hash of the pages of a student: content streams and page
+        attributes (resources, size, rotation...)
+
+    Args:
+        pdf (PdfFileReader): Original pdf.
+        i (int): Student row.
+        n (int): Number of pages per document.
+
+    Returns:
+        str: hash of the pages
+    """
+
+    digest = hashlib.sha256()
+
+    for j in range(n):
+        page = get_page(pdf, n * i + j)
+
+        contents = page.get('/Contents')
+        if contents is not None:
+            contents = contents.getObject()
+            if isinstance(contents, ArrayObject):
+                streams = [item.getObject() for item in contents]
+            else:
+                streams = [contents]
+            for content in streams:
+                digest.update(content._data)
+
+        attributes = DictionaryObject()
+        for key, value in page.items():
+            if key not in ('/Parent', '/Contents'):
+                attributes[key] = value
+
+        data = io.BytesIO()
+        attributes.writeToStream(data, None)
+        digest.update(data.getvalue())
+
+    return digest.hexdigest()
+
+
+class SheetManifest:
+    """ Record of the sheets written by split_pdf(): for each output file,
+        the hash of its pages, the number of pages and a hash of the
+        password. Anything else that writes the sheets has to clear it.
+    """
+
+    def __init__(self, path='gen/sheets_manifest.json'):
+        self.path = path
+
+    def load(self):
+        """ Loads the manifest
+
+        Returns:
+            dict: entry of each output file
+        """
+
+        if not os.path.isfile(self.path):
+            return {}
+
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, entries):
+        """ Saves the manifest replacing the previous one
+
+        Args:
+            entries (dict): entry of each output file
+        """
+
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump(entries, f, indent=1)
+
+        storage.atomic_write(self.path, write)
+
+    def clear(self):
+        """ Removes the manifest, so the next incremental run writes every
+            sheet
+        """
+
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def entry(self, content, n, password):
+        """ Creates the entry of a sheet
+
+        Args:
+            content (str): Hash of the pages
+            n (int): Number of pages per document.
+            password (str or bool): Password to encrypt documents.
+
+        Returns:
+            dict: manifest entry
+        """
+
+        password = hashlib.sha256(str(password).encode()).hexdigest()
+
+        return {'content': content, 'pages': n, 'password': password}
+
+    def changed(self, files, entries):
+        """ Gets the students whose sheet has to be written: new entries,
+            entries that changed and missing files
+
+        Args:
+            files ([str]): Output file of each student.
+            entries (dict): New entry of each output file
+
+        Returns:
+            [int]: rows of the students
+        """
+
+        previous = self.load()
+
+        return [i for i, file in enumerate(files)
+                if previous.get(file) != entries[file]
+                or not os.path.isfile(file)]
+
+    def remove_stale(self, files, folder='sheets'):
+        """ Removes the files of the sheets folder that don't belong to any
+            student
+
+        Args:
+            files ([str]): Output file of each student.
+            folder (str, optional): Sheets folder. Defaults to 'sheets'.
+
+        Returns:
+            int: number of files removed
+        """
+
+        keep = {os.path.normpath(file) for file in files}
+        removed = 0
+
+        for sheet in os.listdir(folder):
+            sheet_file = os.path.join(folder, sheet)
+            if os.path.isfile(sheet_file) and \
+                    os.path.normpath(sheet_file) not in keep:
+                os.remove(sheet_file)
+                removed += 1
+
+        return removed
+
+
+def write_sheet(pdf, i, n, password, output_file):
+    """ Writes the document of a student
+
+    Args:
+        pdf (PdfFileReader): Original pdf.
+        i (int): Student row.
+        n (int): Number of pages per document.
+        password (str or bool): Password to encrypt the document. If set to
+                                false the document is not encrypted.
+        output_file (str): Output file.
+
+    Returns:
+        str: hash of the pages (see sheet_hash)
+    """
+
+    pdf_writer = PdfFileWriter()
+
+    for j in range(n):
+        pdf_writer.addPage(get_page(pdf, n * i + j))
+
+    content = sheet_hash(pdf, i, n)
+
+    if password:
+        encrypt(pdf_writer, password, os.path.basename(output_file),
+                content)
+
+    with open(output_file, 'wb') as out:
+        pdf_writer.write(out)
+
+    return content
+
+
+def get_page(pdf, number):
+    """ Gets a page walking down the page tree. Unlike
+        PdfFileReader.getPage(), that parses and keeps every page of the
+        document, only the nodes on the way to the page are read.
+
+    Args:
+        pdf (PdfFileReader): Original pdf.
+        number (int): Page number (starting at 0).
+
+    Returns:
+        PageObject: page
+    """
+
+    # Attributes that pages inherit from their ancestors
+    inheritable = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+    inherit = {}
+
+    reference = pdf.trailer['/Root'].getObject().raw_get('/Pages')
+    node = reference.getObject()
+
+    while node['/Type'] == '/Pages':
+        for attr in inheritable:
+            if attr in node:
+                inherit[attr] = node[attr]
+
+        kids = node['/Kids']
+
+        # Kids are located directly when all of them are single pages
+        if node['/Count'] == len(kids):
+            kid = kids[number].getObject()
+            if kid['/Type'] == '/Page' or kid['/Count'] == 1:
+                reference, node, number = kids[number], kid, 0
+                continue
+
+        for kid_reference in kids:
+            kid = kid_reference.getObject()
+            count = kid['/Count'] if kid['/Type'] == '/Pages' else 1
+            if number < count:
+                reference, node = kid_reference, kid
+                break
+            number -= count
+        else:
+            raise IndexError('Page number out of range')
+
+    for attr, value in inherit.items():
+        if attr not in node:
+            node[NameObject(attr)] = value
+
+    page = PageObject(pdf, reference)
+    page.update(node)
+
+    return page
+
+
+def encrypt(pdf_writer, password, file_name, content):
+    """ Encrypts a document as PdfFileWriter.encrypt() does (128 bit RC4,
+        owner password equal to user password) but the file identifier is
+        derived from the file name and the content hash instead of the time
+        and a random number. A sheet is always written with the same bytes,
+        and a sheet whose content changes gets a new RC4 key.
+
+    Args:
+        pdf_writer (PdfFileWriter): Document.
+        password (str): Password.
+        file_name (str): Output file name.
+        content (str): Hash of the contents of the document.
+    """
+
+    version, revision, key_length = 2, 3, 16
+    permissions = -1
+
+    # PyPDF2 1.26 internals: _alg33 and _alg35 compute the /O and /U
+    # entries and the file key, and PdfFileWriter.write() encrypts the
+    # objects with _encrypt_key
+    owner = ByteStringObject(_alg33(password, password, revision,
+                                    key_length))
+    file_id = f'{file_name}:{content}'
+    id_1 = ByteStringObject(hashlib.md5(file_id.encode()).digest())
+    id_2 = ByteStringObject(hashlib.md5(id_1).digest())
+    pdf_writer._ID = ArrayObject((id_1, id_2))
+
+    user, key = _alg35(password, revision, key_length, owner, permissions,
+                       id_1, False)
+
+    encryption = DictionaryObject()
+    encryption[NameObject("/Filter")] = NameObject("/Standard")
+    encryption[NameObject("/V")] = NumberObject(version)
+    encryption[NameObject("/Length")] = NumberObject(key_length * 8)
+    encryption[NameObject("/R")] = NumberObject(revision)
+    encryption[NameObject("/O")] = ByteStringObject(owner)
+    encryption[NameObject("/U")] = ByteStringObject(user)
+    encryption[NameObject("/P")] = NumberObject(permissions)
+
+    pdf_writer._encrypt = pdf_writer._addObject(encryption)
+    pdf_writer._encrypt_key = key
+
+
+# Original pdf and sheet parameters of each split process
+_worker = {}
+
+
+def _init_split_worker(pdf_file, n, password, window=None):
+    """ Opens the original pdf once in a split process
+
+    Args:
+        pdf_file (str): Original pdf file.
+        n (int): Number of pages per document.
+        password (str or bool): Password to encrypt documents.
+        window (int, optional): Students per chunk. If set, the file is
+                                read from disk as needed and the objects
+                                parsed in a chunk are released after it.
+                                Defaults to None.
+    """
+
+    if window:
+        _worker['pdf'] = PdfFileReader(open(pdf_file, 'rb'))
+    else:
+        _worker['pdf'] = PdfFileReader(pdf_file)
+
+    _worker['window'] = window
+    _worker['n'] = n
+    _worker['password'] = password
+
+
+def _split_chunk(rows, files):
+    """ Writes the documents of a contiguous range of students in a split
+        process
+
+    Args:
+        rows ([int]): Student rows.
+        files ([str]): Output file of each student in the range.
+
+    Returns:
+        dict: hash of the pages (see sheet_hash) by student row
+    """
+
+    pdf = _worker['pdf']
+    hashes = {}
+
+    for i, output_file in zip(rows, files):
+        hashes[i] = write_sheet(pdf, i, _worker['n'], _worker['password'],
+                                output_file)
+
+    if _worker['window']:
+        release_pages(pdf)
+
+    return hashes
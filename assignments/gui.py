@@ -1,47 +1,113 @@
-from PyQt5.QtWidgets import QFileDialog, QApplication
+import os
 
+# True to ask for files in the console instead of a PyQt5 dialog (batch
+# runs without display). Set with set_headless() or the environment
+# variable ASSIGNMENTS_HEADLESS=1.
+headless = os.environ.get('ASSIGNMENTS_HEADLESS', '') not in ('', '0')
 
-def csv_file(initial='./'):
+
+def set_headless(value=True):
+    """ Enables or disables the headless mode. In headless mode files are
+        asked in the console and PyQt5 and ipywidgets are never imported.
+
+    Args:
+        value (bool, optional): True for headless mode. Defaults to True.
+    """
+
+    global headless
+    headless = value
+
+
+def csv_file(initial='./', path=None):
     """ Opens a dialog to select a CSV file.
 
     Args:
         initial (str, optional): Initial path. Defaults to './'.
+        path (str, optional): File path. If given no dialog is opened.
+                              Defaults to None.
 
     Returns:
         str: Selected file path.
     """
     ext = 'csv'
-    return gui_file(initial, ext)
+    return select_file(initial, ext, path)
 
 
-def pdf_file(initial='./'):
+def pdf_file(initial='./', path=None):
     """ Opens a dialog to select a PDF file.
 
     Args:
         initial (str, optional): Initial path. Defaults to './'.
+        path (str, optional): File path. If given no dialog is opened.
+                              Defaults to None.
 
     Returns:
         str: Selected file path.
     """
     ext = 'pdf'
-    return gui_file(initial, ext)
+    return select_file(initial, ext, path)
 
 
-def excel_file(initial='./'):
+def excel_file(initial='./', path=None):
     """ Opens a dialog to select a XLSX file.
 
     Args:
         initial (str, optional): Initial path. Defaults to './'.
+        path (str, optional): File path. If given no dialog is opened.
+                              Defaults to None.
 
     Returns:
         str: Selected file path.
     """
     ext = 'xlsx'
+    return select_file(initial, ext, path)
+
+
+def select_file(initial='./', ext='csv', path=None):
+    """ Gets a file path: the given path, a console prompt in headless mode
+        or a PyQt5 dialog otherwise
+
+    Args:
+        initial (str, optional): Initial path. Defaults to './'.
+        ext (str, optional): File extension. Defaults to 'csv'.
+        path (str, optional): File path. Defaults to None.
+
+    Returns:
+        str: Selected file path.
+    """
+
+    if path is not None:
+        return path
+
+    if headless:
+        return console_file(initial, ext)
+
     return gui_file(initial, ext)
 
 
+def console_file(initial='./', ext='csv'):
+    """ Asks for a file path in the console (pure Python). Relative paths
+        are taken from the initial path.
+
+    Args:
+        initial (str, optional): Initial path. Defaults to './'.
+        ext (str, optional): File extension. Defaults to 'csv'.
+
+    Returns:
+        str: Selected file path.
+    """
+
+    fname = input(f"Select {ext} file: ").strip()
+
+    if fname and not os.path.isabs(fname):
+        fname = os.path.join(initial, fname)
+
+    return fname
+
+
 def gui_file(initial='./', ext='csv'):
-    """ Opens a dialog to select a file using PyQt5
+    """ Opens a dialog to select a file using PyQt5. The QApplication is
+        created only once and reused by the next dialogs.
 
     Args:
         initial (str, optional): Initial path. Defaults to './'.
@@ -50,10 +116,52 @@ def gui_file(initial='./', ext='csv'):
     Returns:
         str: Selected file path.
     """
-    app = QApplication([initial])
+
+    from PyQt5.QtWidgets import QFileDialog, QApplication
+
+    app = QApplication.instance() or QApplication([initial])
     fname = QFileDialog.getOpenFileName(None,
                                         "Select file",
                                         initial,
                                         filter=f"{ext} files (*.{ext})")
 
     return fname[0].strip().replace('\n', '')
+
+
+class Progress:
+    """ Progress bar replacement for headless runs. It prints the progress
+        every 10 %.
+    """
+
+    def __init__(self):
+        self._value = 0.0
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if int(value * 10) > int(self._value * 10):
+            print(f'{int(value * 10) * 10} %')
+        self._value = value
+
+
+def progress_bar():
+    """ Creates and displays a progress bar: an ipywidget in Jupyter or a
+        Progress object in headless mode
+
+    Returns:
+        widget: progress bar with a value between 0 and 1
+    """
+
+    if headless:
+        return Progress()
+
+    from IPython.display import display
+    import ipywidgets as widgets
+
+    progress = widgets.FloatProgress(value=0.0, min=0.0, max=1.0)
+    display(progress)
+
+    return progress
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+
+
+class SendJournal:
+    """ Append-only log of the emails sent to the students, one JSON line
+        per email keyed by student id and message type ('assignment' or
+        'grade'). Bulk senders skip the students that already received an
+        email of the same type, so an interrupted run can be repeated.
+    """
+
+    def __init__(self, path='gen/send_journal.jsonl'):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def entries(self):
+        """ Reads the journal entries. A line cut by an interrupted write is
+            ignored.
+
+        Returns:
+            [dict]: journal entries in the order they were written
+        """
+
+        if not os.path.isfile(self.path):
+            return []
+
+        entries = []
+
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+
+        return entries
+
+    def completed(self, kind):
+        """ Gets the students that already received an email of a type
+            (since the last reset of that type)
+
+        Args:
+            kind (str): Message type ('assignment' or 'grade')
+
+        Returns:
+            set: student ids (as strings)
+        """
+
+        done = set()
+
+        for entry in self.entries():
+            if entry.get('type') != kind:
+                continue
+            if entry.get('reset'):
+                done = set()
+            elif entry.get('sent'):
+                done.add(entry['id'])
+
+        return done
+
+    def record(self, id, kind, sent, attempts=1, error=None):
+        """ Appends the result of an email to the journal. The line is
+            flushed to disk before returning.
+
+        Args:
+            id: Student id
+            kind (str): Message type ('assignment' or 'grade')
+            sent (bool): True if the email was sent
+            attempts (int, optional): Send attempts. Defaults to 1.
+            error (Exception, optional): Last error. Defaults to None.
+        """
+
+        entry = {'id': str(id),
+                 'type': kind,
+                 'sent': bool(sent),
+                 'attempts': int(attempts),
+                 'time': time.time()}
+
+        if error is not None:
+            entry['error'] = repr(error)
+
+        self.append(entry)
+
+    def reset(self, kind):
+        """ Marks all the emails of a type as not sent, so the next run
+            sends them again (e.g. grades sent after grading again)
+
+        Args:
+            kind (str): Message type ('assignment' or 'grade')
+        """
+
+        self.append({'type': kind, 'reset': True, 'time': time.time()})
+
+    def append(self, entry):
+        """ Appends an entry to the journal
+
+        Args:
+            entry (dict): journal entry
+        """
+
+        line = json.dumps(entry) + '\n'
+
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
@@ -1,15 +1,27 @@
-from O365 import Account
-from IPython.display import display
-import ipywidgets as widgets
 import codecs
+import functools
 import json
 import random
 import numpy as np
+import pandas as pd
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from . import gui
+from . import journal
+from . import templates
+from . import throttling
 
 # Deactivates deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# Messages sent at the same time by default (Outlook allows up to 4
+# concurrent requests per mailbox)
+max_in_flight = 4
+
+# Messages per second and retries of throttled or failed messages
+rate = 4
+retries = 5
+
 # email template filepaths
 email_template = 'resources/templates/email_template.html'
 grade_email_template = 'resources/templates/grade_email_template.html'
@@ -26,17 +38,39 @@ def o365_login(id_app, secret):
         Account: Azure app handler
     """
 
+    from O365 import Account
+
     credentials = (id_app, secret)
     account = Account(credentials)
     account.authenticate(scopes=['basic', 'message_all'])
     return account
 
 
-def generate_body(student_name, assignment):
+def generate_body(student_name, assignment, template=None):
     """ Generates the body of the email to send the assignment
 
     Args:
-        template_path (str): location of the message template
+        student_name (str): Name of the student
+        assignment (Assigment): Assigment object
+        template (Template, optional): Email template. Loaded if it is not
+                                       given. Defaults to None.
+
+    Returns:
+        str: email body text
+    """
+
+    if template is None:
+        template = templates.load_template(email_template, assignment)
+
+    return template.render({'name': student_name})
+
+
+def generate_body_replace(student_name, assignment):
+    """ Generates the body of the email to send the assignment reading the
+        template and replacing each placeholder. Reference implementation
+        of generate_body().
+
+    Args:
         student_name (str): Name of the student
         assignment (Assigment): Assigment object
 
@@ -80,7 +114,8 @@ def generate_subject(assignment):
     return name + " - " + code
 
 
-def send_email(account, assignment, email, name, attachment=False):
+def send_email(account, assignment, email, name, attachment=False,
+               template=None):
     """ Sends individual emails with assignment to specified student.
 
     Args:
@@ -91,6 +126,8 @@ def send_email(account, assignment, email, name, attachment=False):
         attachment (bool, str, optional): Attachment path.
                 If False, email is sent without attachments.
                 Defaults to False.
+        template (Template, optional): Email template. Loaded if it is not
+                                       given. Defaults to None.
 
     Returns:
         bool: True if message is sent, False otherwise
@@ -99,51 +136,156 @@ def send_email(account, assignment, email, name, attachment=False):
     m = account.new_message()
     m.to.add(email)
     m.subject = generate_subject(assignment)
-    m.body = generate_body(name, assignment)
+    m.body = generate_body(name, assignment, template)
     if attachment:
         m.attachments.add(attachment)
     return m.send()
 
 
-def send_email_list(account, assignment):
+def send_email_list(account, assignment, max_in_flight=max_in_flight,
+                    rate=rate, retries=retries, report=False, resume=True):
     """ Sends assignment emails to the student list
 
     Args:
         account (Account): Azure app handler
         assignment (Assigment): Assigment object
+        max_in_flight (int, optional): Maximum number of emails sent at the
+                                       same time. Defaults to 4.
+        rate (float, optional): Maximum number of emails sent per second.
+                                Defaults to 4.
+        retries (int, optional): Retries of throttled or failed emails.
+                                 Defaults to 5.
+        report (bool, optional): True to return also a DataFrame with the
+                                 attempts and latency of each email.
+                                 Defaults to False.
+        resume (bool, optional): True to skip the students that already
+                                 received the assignment according to the
+                                 send journal (gen/send_journal.jsonl).
+                                 False sends to all the students.
+                                 Defaults to True.
 
     Returns:
-        bool: list with send status to all emails
+        bool: list with send status to all emails (and report DataFrame)
     """
 
     data = assignment.student_list
+    template = templates.load_template(email_template, assignment)
+
+    def send(i):
+        return send_email(account,
+                          assignment,
+                          data['email'][i],
+                          data['name'][i],
+                          data['file'][i],
+                          template)
+
+    ids = data['id'].to_list()
+
+    log = journal.SendJournal()
+    if not resume:
+        log.reset('assignment')
+
+    sent, attempts = send_all(send, list(range(len(data))), max_in_flight,
+                              rate, retries, log, 'assignment', ids)
+
+    if report:
+        attempts.insert(0, 'id', ids)
+        return sent, attempts
+
+    return sent
+
 
-    max_progess = len(data) - 1
-    progress = widgets.FloatProgress(value=0.0, min=0.0, max=max_progess)
+def send_all(send, items, max_in_flight=max_in_flight, rate=rate,
+             retries=retries, journal=None, kind=None, ids=None):
+    """ Sends the email of every item with up to max_in_flight emails being
+        sent at the same time and no more than rate emails per second.
+        Throttled (429) and transient errors are retried with exponential
+        backoff honoring the Retry-After header. The progress bar is
+        updated as the emails are sent and an email that still fails is
+        reported as not sent. With a journal, the items that already
+        received the email are skipped and every result is recorded.
+
+    Args:
+        send (function): Function that sends the email of an item,
+                         send(item), and returns True if it is sent.
+        items (list): Items (e.g. student rows or IDs)
+        max_in_flight (int, optional): Maximum number of emails sent at the
+                                       same time. Defaults to 4.
+        rate (float, optional): Maximum number of emails sent per second.
+                                Defaults to 4.
+        retries (int, optional): Retries of throttled or failed emails.
+                                 Defaults to 5.
+        journal (SendJournal, optional): Send journal. Defaults to None.
+        kind (str, optional): Message type in the journal ('assignment' or
+                              'grade'). Defaults to None.
+        ids (list, optional): Student id of each item for the journal and
+                              the error messages. Defaults to items.
+
+    Returns:
+        tuple: send status of each item, in the order of items, and
+               DataFrame with the attempts, latency and error of each item
+    """
+
+    total = len(items)
 
     print('------')
     print("Sending emails")
-    display(progress)
+    progress = gui.progress_bar()
 
-    sent = []
-    for i in range(len(data)):
-        email = data['email'][i]
-        name = data['name'][i]
-        attachment = data['file'][i]
-        sent.append(send_email(account,
-                               assignment,
-                               email,
-                               name,
-                               attachment))
+    bucket = throttling.TokenBucket(rate)
+    results = [None] * total
+
+    if ids is None:
+        ids = items
+
+    pending = list(range(total))
+
+    if journal is not None:
+        done = journal.completed(kind)
+        pending = [k for k in pending if str(ids[k]) not in done]
+
+        for k in set(range(total)) - set(pending):
+            results[k] = {'sent': True,
+                          'attempts': 0,
+                          'latency (s)': 0.0,
+                          'error': None}
+
+        if len(pending) < total:
+            print(f'-- {total - len(pending)} emails already sent '
+                  f'(journal) ... skipped')
+            progress.value = float(total - len(pending)) / total
+
+    def send_item(item):
+        return throttling.send_with_retry(functools.partial(send, item),
+                                          bucket, retries)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+
+        futures = {executor.submit(send_item, items[k]): k for k in pending}
+
+        for future in as_completed(futures):
+            k = futures[future]
+            results[k] = future.result()
+
+            if journal is not None:
+                journal.record(ids[k], kind, results[k]['sent'],
+                               results[k]['attempts'], results[k]['error'])
+
+            if results[k]['error'] is not None:
+                print(f'** {ids[k]} ... not sent '
+                      f'({results[k]["attempts"]} attempts)')
+                print(f'**** Error: {results[k]["error"]!r}')
+
+            progress.value += 1.0 / total
 
-        progress.value = i
+    sent = [result['sent'] for result in results]
 
     if all(sent):
         print('Emails sent with no errors')
     else:
         print('Some emails not sent (check function return')
 
-    return sent
+    return sent, pd.DataFrame(results)
 
 
 def load_credentials(path):
@@ -180,7 +322,70 @@ def send_test_email(account, assignment, email):
     send_email(account, assignment, email, name, attachment)
 
 
-def generate_grading_table(assignment, titles, id):
+def grade_index(assignment):
+    """ Joins the data of every graded student needed for the grade emails
+        (name, email, answers, solutions, points and grade), so the data of
+        each email is obtained with a single lookup by student id
+
+    Args:
+        assignment (Assigment): Assigment object
+
+    Returns:
+        dict: student data by student id
+    """
+
+    answer_names = list(assignment.solutions.columns)[1:]
+
+    students = assignment.student_list.drop_duplicates('id').set_index('id')
+    students = students[['number', 'name', 'email']].to_dict('index')
+    solutions = assignment.solutions.drop_duplicates('number')
+    solutions = solutions.set_index('number')[answer_names].to_numpy()
+    solution_row = {number: k for k, number
+                    in enumerate(assignment.solutions['number'].unique())}
+
+    answers = assignment.answers.drop_duplicates('id')
+    answer_row = {id: k for k, id in enumerate(answers['id'])}
+    answers = answers[answer_names]
+    # Rows with missing answers keep the type of each column (as a row of
+    # an object DataFrame), complete rows share a single type
+    answers_values = answers.to_numpy()
+    answers_objects = answers.astype(object).to_numpy()
+    answers_missing = answers.isna().to_numpy()
+
+    grades = assignment.grades.drop_duplicates('id')
+    points = grades[answer_names].to_numpy()
+    grade = np.round(grades['grade'].to_numpy(), decimals=1)
+    total = grades['points'].to_numpy()
+
+    index = {}
+
+    for k, id in enumerate(grades['id']):
+        student = students[id]
+
+        if id not in answer_row:
+            student_answers = ['-'] * len(answer_names)
+        else:
+            row = answer_row[id]
+            if answers_missing[row].any():
+                student_answers = ['-' if missing else value
+                                   for value, missing
+                                   in zip(answers_objects[row],
+                                          answers_missing[row])]
+            else:
+                student_answers = answers_values[row].tolist()
+
+        index[id] = {'name': student['name'],
+                     'email': student['email'],
+                     'answers': student_answers,
+                     'solutions': solutions[solution_row[student['number']]],
+                     'points': points[k].tolist(),
+                     'grade': grade[k],
+                     'total': total[k]}
+
+    return index
+
+
+def generate_grading_table(assignment, titles, id, index=None):
     """ Generates a table with student answers, correct solutions and
         assignment points per question
 
@@ -188,27 +393,21 @@ def generate_grading_table(assignment, titles, id):
         assignment (Assigment): Assigment object
         titles (str, list): List with table titles
         id (str): Student id
+        index (dict, optional): Student data from grade_index(). Built if
+                                it is not given. Defaults to None.
 
     Returns:
         str: HTML formated grading table
     """
 
-    answer_names = list(assignment.solutions.columns)[1:]
-    answers = assignment.answers[assignment.answers['id'] == id][answer_names]
-    if answers.empty:
-        answers = ['-'] * len(answer_names)
-    else:
-        answers = answers.fillna('-')
-        answers = answers.iloc[0].to_list()
-
-    id_selection = assignment.student_list['id'] == id
-    number = assignment.student_list[id_selection]['number'].item()
+    if index is None:
+        index = grade_index(assignment)
 
-    number_selection = assignment.solutions['number'] == number
-    solutions = assignment.solutions[number_selection][answer_names]
+    student = index[id]
+    answer_names = list(assignment.solutions.columns)[1:]
 
     solutions_string = []
-    for solution in solutions.iloc[0].to_list():
+    for solution in student['solutions'].tolist():
         if np.abs(solution) >= 0.01:
             num = np.round(solution, decimals=4)
             num_format = '{}'
@@ -218,10 +417,7 @@ def generate_grading_table(assignment, titles, id):
 
         solutions_string.append(num_format.format(num))
 
-    points = assignment.grades[assignment.grades['id'] == id][answer_names]
-    points = points.iloc[0].to_list()
-
-    rows = [answers, solutions_string, points]
+    rows = [student['answers'], solutions_string, student['points']]
 
     table = '<center>\n <table border="1"'
     table += ' cellspacing="0" cellpadding="5" align="center">\n'
@@ -244,80 +440,190 @@ def generate_grading_table(assignment, titles, id):
     return table
 
 
-def send_grade_list(account, assignment, titles):
+def grading_tables(assignment, titles):
+    """ Generates the grading tables of all the graded students at once
+        (same HTML as generate_grading_table()). Answers, solutions and
+        points are formatted as whole matrices.
+
+    Args:
+        assignment (Assigment): Assigment object
+        titles (str, list): List with table titles
+
+    Returns:
+        dict: HTML formated grading table by student id
+    """
+
+    answer_names = list(assignment.solutions.columns)[1:]
+    grades = assignment.grades.drop_duplicates('id')
+    ids = grades['id'].to_list()
+
+    students = assignment.student_list.drop_duplicates('id').set_index('id')
+    numbers = students.loc[ids, 'number']
+
+    solutions = assignment.solutions.drop_duplicates('number')
+    solutions = solutions.set_index('number').loc[numbers, answer_names]
+
+    rows = [format_answers(assignment.answers, ids, answer_names),
+            format_solutions(solutions.to_numpy(dtype=float)),
+            grades[answer_names].to_numpy().astype(str).astype(object)]
+
+    header = '<center>\n <table border="1"'
+    header += ' cellspacing="0" cellpadding="5" align="center">\n'
+    header += '\t<tr>\n\t\t<th> </th>\n'
+    header += ''.join(f'\t\t<th>{column}</th>\n' for column in answer_names)
+    header += '\t</tr>\n'
+
+    tables = [header] * len(ids)
+
+    for title, values in zip(titles, rows):
+        cells = '\t\t<td style="text-align:center">' + values + '</td>\n'
+        row_start = f'\t<tr>\n\t\t<th>{title}</th>\n'
+        tables = [table + row_start + ''.join(row) + '\t</tr>\n'
+                  for table, row in zip(tables, cells.tolist())]
+
+    return {id: table + '</table>\n</center>'
+            for id, table in zip(ids, tables)}
+
+
+def format_solutions(solutions):
+    """ Formats solutions for the grading tables: rounded to 4 decimals or
+        in scientific notation if they are smaller than 0.01
+
+    Args:
+        solutions (ndarray): solutions
+
+    Returns:
+        ndarray: formatted solutions (object array of str)
+    """
+
+    large = np.abs(solutions) >= 0.01
+    rounded = np.round(solutions, decimals=4).astype(str)
+    scientific = np.char.mod('%.4e', solutions)
+
+    return np.where(large, rounded, scientific).astype(object)
+
+
+def format_answers(answers, ids, answer_names):
+    """ Formats the answers of some students for the grading tables.
+        Missing answers are shown as '-'.
+
+    Args:
+        answers (DataFrame): answers
+        ids (list): student ids
+        answer_names ([str]): answer columns
+
+    Returns:
+        ndarray: formatted answers (object array of str)
+    """
+
+    answers = answers.drop_duplicates('id')
+    positions = pd.Index(answers['id']).get_indexer(ids)
+    answers = answers[answer_names]
+
+    # Rows with missing answers keep the type of each column, complete rows
+    # share a single type (as the rows of a DataFrame)
+    common = answers.to_numpy().astype(str)
+    own = np.column_stack([answers[column].to_numpy().astype(str)
+                           for column in answer_names])
+    missing = answers.isna().to_numpy()
+
+    text = np.where(missing, '-', own)
+    text = np.where(missing.any(axis=1, keepdims=True), text, common)
+
+    formatted = np.full((len(ids), len(answer_names)), '-', dtype=object)
+    found = positions >= 0
+    formatted[found] = text[positions[found]]
+
+    return formatted
+
+
+def send_grade_list(account, assignment, titles,
+                    max_in_flight=max_in_flight, rate=rate, retries=retries,
+                    report=False, resume=True):
     """ Sends grade to the student list.
 
     Args:
         account (Account): Azure app handler.
         assignment (Assigment): Assigment object.
         titles ([str]): Grading table headers.
+        max_in_flight (int, optional): Maximum number of emails sent at the
+                                       same time. Defaults to 4.
+        rate (float, optional): Maximum number of emails sent per second.
+                                Defaults to 4.
+        retries (int, optional): Retries of throttled or failed emails.
+                                 Defaults to 5.
+        report (bool, optional): True to return also a DataFrame with the
+                                 attempts and latency of each email.
+                                 Defaults to False.
+        resume (bool, optional): True to skip the students that already
+                                 received the grade according to the send
+                                 journal (gen/send_journal.jsonl). False
+                                 sends to all the students (e.g. after
+                                 grading again). Defaults to True.
 
     Returns:
-        [bool]: list with True if the email was sent, False otherwise.
+        [bool]: list with True if the email was sent, False otherwise (and
+                report DataFrame).
     """
 
-    grades = assignment.grades
+    ids = assignment.grades['id'].to_list()
+    index = grade_index(assignment)
+    tables = grading_tables(assignment, titles)
+    template = templates.load_template(grade_email_template, assignment)
 
-    max_progess = len(grades) - 1
-    progress = widgets.FloatProgress(value=0.0, min=0.0, max=max_progess)
+    def send(id):
+        return send_grade_email(account, assignment, id, titles, index=index,
+                                table=tables[id], template=template)
 
-    print('------')
-    print("Sending emails")
-    display(progress)
+    log = journal.SendJournal()
+    if not resume:
+        log.reset('grade')
 
-    sent = []
+    sent, attempts = send_all(send, ids, max_in_flight, rate, retries, log,
+                              'grade')
 
-    for i, id in enumerate(assignment.grades['id']):
-        sent.append(send_grade_email(account, assignment, id, titles))
-
-        progress.value = i + 1
-
-    if all(sent):
-        print('Emails sent with no errors')
-    else:
-        print('Some emails not sent (check function return')
+    if report:
+        attempts.insert(0, 'id', ids)
+        return sent, attempts
 
     return sent
 
 
-def generate_grade_body(id, assignment, titles):
+def generate_grade_body(id, assignment, titles, index=None, table=None,
+                        template=None):
     """ Generates the body of the grade sending email
 
     Args:
         id (str): Student ID
         assignment (Assigment): Assigment object
         titles ([str]): Grading table headers
+        index (dict, optional): Student data from grade_index(). Built if
+                                it is not given. Defaults to None.
+        table (str, optional): Grading table from grading_tables().
+                               Generated if it is not given.
+                               Defaults to None.
+        template (Template, optional): Email template. Loaded if it is not
+                                       given. Defaults to None.
 
     Returns:
         [str]: HTML formated email body
     """
 
-    grading_table = generate_grading_table(assignment, titles, id)
-
-    st_list = assignment.student_list
-
-    student_name = st_list[assignment.student_list['id'] == id]['name'].item()
-
-    grades = assignment.grades[assignment.grades['id'] == id]
-
-    grade = np.round(grades['grade'].values[0], decimals=1)
-    points = grades['points'].values[0]
-
-    with codecs.open(grade_email_template, 'r') as f:
+    if index is None:
+        index = grade_index(assignment)
 
-        body = f.read()
-        data = assignment.config
+    if table is None:
+        table = generate_grading_table(assignment, titles, id, index)
 
-        for i in range(len(data)):
-            key = "[[" + data['Variable'][i] + "]]"
-            body = body.replace(key, str(data['Value'][i]))
+    student = index[id]
 
-        body = body.replace('[[name]]', student_name)
-        body = body.replace('[[grade_table]]', grading_table)
-        body = body.replace('[[grade]]', str(grade))
-        body = body.replace('[[points]]', str(points))
+    if template is None:
+        template = templates.load_template(grade_email_template, assignment)
 
-    return body
+    return template.render({'name': student['name'],
+                            'grade_table': table,
+                            'grade': student['grade'],
+                            'points': student['total']})
 
 
 def generate_grade_subject(assignment):
@@ -341,7 +647,8 @@ def generate_grade_subject(assignment):
     return name + " - " + code
 
 
-def send_grade_email(account, assignment, id, titles, email=False):
+def send_grade_email(account, assignment, id, titles, email=False,
+                     index=None, table=None, template=None):
     """ Send individual grading email
 
     Args:
@@ -352,20 +659,29 @@ def send_grade_email(account, assignment, id, titles, email=False):
         email (str or bool, optional): email to send message, if set to
                                        false obtains it from assignment
                                        object. Defaults to False.
+        index (dict, optional): Student data from grade_index(). Built if
+                                it is not given. Defaults to None.
+        table (str, optional): Grading table from grading_tables().
+                               Generated if it is not given.
+                               Defaults to None.
+        template (Template, optional): Email template. Loaded if it is not
+                                       given. Defaults to None.
 
     Returns:
         [bool]: Send status.
     """
 
-    st_list = assignment.student_list
+    if index is None:
+        index = grade_index(assignment)
 
     if not email:
-        email = st_list[st_list['id'] == id]['email'].item()
+        email = index[id]['email']
 
     m = account.new_message()
     m.to.add(email)
     m.subject = generate_grade_subject(assignment)
-    m.body = generate_grade_body(id, assignment, titles)
+    m.body = generate_grade_body(id, assignment, titles, index, table,
+                                 template)
 
     return m.send()
 
@@ -0,0 +1,614 @@
+import math
+import re
+import numpy as np
+import pandas as pd
+
+
+# Columns of var_config. Constraint and Expression are optional (files of
+# older versions do not have them). Constraint is an expression of the
+# variables and student data that must be true for every student, e.g.
+# 'V2 != 0' or 'V1 > V3'. A variable with an Expression (e.g. 'V3 * number'
+# or 'id / V2') is derived from the others instead of drawn.
+config_columns = ['Variable', 'Min value', 'Max value', 'Step', 'Decimals',
+                  'Unit', 'Constraint', 'Expression']
+
+# Names used in an expression
+identifier = re.compile(r'[A-Za-z_][A-Za-z_0-9]*')
+
+
+def config_frame(var_config):
+    """ Gets a variable configuration with all the columns of
+        config_columns (the missing ones are left empty)
+
+    Args:
+        var_config (DataFrame): Variable configuration
+
+    Returns:
+        DataFrame: variable configuration
+    """
+
+    var_config = var_config.copy()
+
+    for column in config_columns:
+        if column not in var_config:
+            var_config[column] = ''
+
+    return var_config[config_columns]
+
+
+def empty_row(name):
+    """ Creates the row of a new variable for the configuration table
+
+    Args:
+        name (str): Variable name
+
+    Returns:
+        list: row values, in config_columns order
+    """
+
+    return [name, 0, 0, 0, 0, ''] + [''] * (len(config_columns) - 6)
+
+
+def expression_column(var_config, column):
+    """ Gets a text column of a variable configuration
+
+    Args:
+        var_config (DataFrame): Variable configuration
+        column (str): 'Constraint' or 'Expression'
+
+    Returns:
+        Series: stripped text ('' if the column is missing)
+    """
+
+    if column not in var_config:
+        return pd.Series('', index=var_config.index)
+
+    return var_config[column].fillna('').astype(str).str.strip()
+
+
+def constraints(var_config):
+    """ Gets the constraint expressions of a variable configuration
+
+    Args:
+        var_config (DataFrame): Variable configuration
+
+    Returns:
+        [str]: non empty expressions
+    """
+
+    expressions = expression_column(var_config, 'Constraint')
+
+    return [expression for expression in expressions if expression]
+
+
+def derived_variables(var_config):
+    """ Gets the derived variables of a configuration in evaluation order:
+        every variable goes after the derived variables it uses
+
+    Args:
+        var_config (DataFrame): Variable configuration
+
+    Returns:
+        [tuple]: name, expression and decimals (None to keep all of them)
+                 of each derived variable
+    """
+
+    expressions = expression_column(var_config, 'Expression')
+    derived = {}
+
+    for i in np.flatnonzero(expressions != ''):
+        name = str(var_config['Variable'].iloc[i])
+        decimals = pd.to_numeric(var_config['Decimals'].iloc[i],
+                                 errors='coerce')
+        decimals = None if pd.isna(decimals) else int(decimals)
+        derived[name] = (expressions.iloc[i], decimals)
+
+    # Kahn's algorithm over the uses of derived variables
+    uses = {name: set(identifier.findall(expression)) & set(derived)
+            for name, (expression, _) in derived.items()}
+    order = []
+    ready = [name for name in derived if not uses[name]]
+
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        for other in derived:
+            if name in uses[other]:
+                uses[other].discard(name)
+                if not uses[other]:
+                    ready.append(other)
+
+    if len(order) < len(derived):
+        cycle = sorted(set(derived) - set(order))
+        raise ValueError(f'Circular dependency between the derived '
+                         f'variables {cycle}')
+
+    return [(name,) + derived[name] for name in order]
+
+
+def new_seed():
+    """ Creates a random seed for an assignment
+
+    Returns:
+        int: seed (9 digits at most, so it is stored exactly in any file)
+    """
+
+    return int(np.random.SeedSequence().entropy % 10 ** 9)
+
+
+def variable_grid(var_config):
+    """ Gets the values that each drawn variable (without Expression) can
+        take, from var_config
+
+    Args:
+        var_config (DataFrame): Variable configuration
+
+    Returns:
+        tuple: names, minimum values, steps, number of values and decimals
+               of the variables
+    """
+
+    var_config = var_config[expression_column(var_config,
+                                              'Expression') == '']
+
+    names = var_config['Variable'].astype(str).to_list()
+    low = var_config['Min value'].to_numpy(dtype=float)
+    up = var_config['Max value'].to_numpy(dtype=float)
+    step = var_config['Step'].to_numpy(dtype=float)
+    decimals = var_config['Decimals'].to_numpy(dtype=int)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        levels = np.floor((up - low) / step + 1)
+
+    for i, name in enumerate(names):
+        if not (np.isfinite(low[i]) and np.isfinite(up[i])):
+            raise ValueError(f'Variable {name}: Min value and Max value '
+                             f'must be finite numbers')
+        if not step[i] > 0:
+            raise ValueError(f'Variable {name}: Step must be positive')
+        if not levels[i] >= 1:
+            raise ValueError(f'Variable {name}: Max value must not be '
+                             f'smaller than Min value')
+        if not levels[i] < 2 ** 53:
+            raise ValueError(f'Variable {name}: too many values, use a '
+                             f'larger Step')
+
+    return names, low, step, levels.astype(np.int64), decimals
+
+
+def block_width(nv):
+    """ Random numbers drawn per student: the number of variables rounded
+        up to the 4 numbers of a Philox block, so the numbers of a student
+        start at a position of the stream that can be jumped to
+
+    Args:
+        nv (int): Number of variables
+
+    Returns:
+        int: numbers per student
+    """
+
+    return 4 * math.ceil(nv / 4)
+
+
+def uniform(seed, numbers, nv, attempt=0):
+    """ Draws uniform numbers in [0, 1) for a set of students. Student
+        number k gets the k-th block of the Philox stream of (seed,
+        attempt), so the numbers of a student only depend on the seed, the
+        attempt and its number. All the students are drawn in one call.
+
+    Args:
+        seed (int): Assignment seed
+        numbers (array): Student numbers (non negative integers)
+        nv (int): Numbers per student
+        attempt (int, optional): Draw attempt. Defaults to 0.
+
+    Returns:
+        array: uniform numbers, one row per student
+    """
+
+    numbers = np.asarray(numbers, dtype=np.int64)
+    width = block_width(nv)
+
+    if numbers.size == 0:
+        return np.empty((0, nv))
+
+    first = int(numbers.min())
+    rows = int(numbers.max()) - first + 1
+
+    # each Philox counter gives 4 numbers, so block k starts at k * width / 4
+    bit_generator = np.random.Philox(np.random.SeedSequence([seed, attempt]))
+    bit_generator.advance(first * width // 4)
+
+    draws = np.empty((rows, width))
+    np.random.Generator(bit_generator).random(out=draws)
+
+    # consecutive numbers (the usual student list) need no copy
+    if rows == len(numbers) and np.all(np.diff(numbers) == 1):
+        return draws[:, :nv]
+
+    return draws[numbers - first, :nv]
+
+
+# Tuples of variables are drawn from a permutation of the grid (instead
+# of the stream of each student) when the grid has at most dense_factor
+# times as many combinations as students, so unique tuples are not found
+# by trial and error
+dense_factor = 4
+
+# Stream of the grid permutation (attempts of the students use 0, 1, ...)
+permutation_stream = 2 ** 32 - 1
+
+
+def grid_digits(draws, levels):
+    """ Maps uniform numbers to the position of each variable in its grid
+
+    Args:
+        draws (array): Uniform numbers, one row per student and one column
+                       per variable
+        levels (array): Number of values of each variable
+
+    Returns:
+        array: positions (as floats), one row per student
+    """
+
+    digits = draws * levels
+    np.floor(digits, out=digits)
+    np.minimum(digits, levels - 1, out=digits)
+
+    return digits
+
+
+def combinations(levels):
+    """ Number of different tuples of variables (exact, it can be larger
+        than the integers of NumPy)
+
+    Args:
+        levels (array): Number of values of each variable
+
+    Returns:
+        int: size of the grid
+    """
+
+    return math.prod(int(level) for level in levels)
+
+
+def decode(index, levels):
+    """ Gets the position of each variable from the index of a tuple in the
+        grid, read as a mixed-radix number (the last variable is the least
+        significant digit). The grid itself is never built.
+
+    Args:
+        index (array): Tuple indexes (smaller than combinations(levels))
+        levels (array): Number of values of each variable
+
+    Returns:
+        array: positions (as floats), one row per tuple
+    """
+
+    index = np.asarray(index, dtype=np.int64)
+    digits = np.empty((len(index), len(levels)))
+
+    for j in reversed(range(len(levels))):
+        index, digits[:, j] = np.divmod(index, levels[j])
+
+    return digits
+
+
+def digit_values(digits, low, step, decimals):
+    """ Maps grid positions to the values of the variables (in place)
+
+    Args:
+        digits (array): Grid positions, one row per student and one column
+                        per variable
+        low (array): Minimum value of each variable
+        step (array): Step of each variable
+        decimals (array): Decimals of each variable
+
+    Returns:
+        array: variable values, one row per student
+    """
+
+    values = digits
+    values *= step
+    values += low
+
+    groups = np.unique(decimals)
+
+    if len(groups) == 1:
+        np.round(values, decimals=groups[0], out=values)
+    else:
+        for j in groups:
+            columns = np.flatnonzero(decimals == j)
+            values[:, columns] = np.round(values[:, columns], decimals=j)
+
+    # -0.0 becomes 0.0, so equal tuples are found by their hash
+    values += 0.0
+
+    return values
+
+
+def grid_permutation(seed, size):
+    """ Shuffles the indexes of a grid from the assignment seed
+
+    Args:
+        seed (int): Assignment seed
+        size (int): Number of tuples of the grid
+
+    Returns:
+        array: tuple indexes in random order
+    """
+
+    sequence = np.random.SeedSequence([seed, permutation_stream])
+    generator = np.random.Generator(np.random.Philox(sequence))
+
+    return generator.permutation(size)
+
+
+def duplicates(values, numbers, pending):
+    """ Finds the students with the same tuple of variables as another one.
+        The tuples of the settled students are kept first, then the ones of
+        the pending students in number order.
+
+    Args:
+        values (array): Variable values, one row per student
+        numbers (array): Student numbers
+        pending (array): True for the students drawn again in this
+                         iteration
+
+    Returns:
+        array: True for the students whose tuple is already taken
+    """
+
+    order = np.lexsort((numbers, pending))
+    repeated = pd.DataFrame(values[order], copy=False).duplicated()
+
+    result = np.empty(len(values), dtype=bool)
+    result[order] = repeated.to_numpy()
+
+    return result
+
+
+def variable_frame(values, names, students=None, derived=()):
+    """ Creates the DataFrame of the drawn variables, the student data and
+        the derived variables, evaluated over whole columns with
+        DataFrame.eval (numexpr if it is installed)
+
+    Args:
+        values (array): Drawn variable values, one row per student
+        names ([str]): Drawn variable names
+        students (DataFrame, optional): Student data of the same rows.
+                                        Defaults to None.
+        derived ([tuple], optional): Derived variables, as given by
+                                     derived_variables(). Defaults to ().
+
+    Returns:
+        DataFrame: student data and variables
+    """
+
+    frame = pd.DataFrame(values, columns=names, copy=False)
+
+    if students is not None:
+        taken = names + [variable[0] for variable in derived]
+        students = students.drop(columns=taken, errors='ignore')
+        frame = pd.concat([students.reset_index(drop=True), frame], axis=1)
+
+    for name, expression, decimals in derived:
+        result = frame.eval(expression)
+        result = np.broadcast_to(np.asarray(result, dtype=float), len(frame))
+        if decimals is not None:
+            result = np.round(result, decimals=decimals)
+        frame[name] = result
+
+    return frame
+
+
+def violations(frame, expressions):
+    """ Evaluates the constraints over whole columns
+
+    Args:
+        frame (DataFrame): Student data and variables
+        expressions ([str]): Constraint expressions
+
+    Returns:
+        array: True for the students that do not meet every constraint
+    """
+
+    valid = np.ones(len(frame), dtype=bool)
+
+    for expression in expressions:
+        valid &= np.asarray(frame.eval(expression), dtype=bool)
+
+    return ~valid
+
+
+def generate(var_config, numbers, seed, students=None, max_iterations=100,
+             unique=False, report=False):
+    """ Generates the variables of a set of students in a preallocated 2-D
+        array and evaluates the derived ones. The students that do not
+        meet the constraints of var_config (or, with unique, that got the
+        tuple of another student) are drawn again, all at once, with the
+        next attempt of their stream until every constraint holds or
+        max_iterations is reached. The values of a student still depend
+        only on the seed and its number (and its data if the constraints
+        use it) unless it collides with another student.
+
+        With unique, dense grids (up to dense_factor combinations per
+        student) are sampled without replacement from a permutation of the
+        tuple indexes instead.
+
+    Args:
+        var_config (DataFrame): Variable configuration
+        numbers (array): Student numbers
+        seed (int): Assignment seed
+        students (DataFrame, optional): Student data of each number, used
+                                        by the constraints and derived
+                                        variables. Defaults to None.
+        max_iterations (int, optional): Maximum number of times the
+                                        students are drawn again.
+                                        Defaults to 100.
+        unique (bool, optional): True to give a different tuple of drawn
+                                 variables to every student.
+                                 Defaults to False.
+        report (bool, optional): True to return also the rejection
+                                 statistics. Defaults to False.
+
+    Returns:
+        DataFrame: variables, one row per student and one column per
+                   variable (and dict with the iterations, draws, rejected
+                   draws, rejection rate and students that do not meet the
+                   constraints)
+    """
+
+    names, low, step, levels, decimals = variable_grid(var_config)
+    expressions = constraints(var_config)
+    derived = derived_variables(var_config)
+    numbers = np.asarray(numbers, dtype=np.int64)
+    n = len(numbers)
+    size = combinations(levels)
+
+    if unique and size < n:
+        raise ValueError(f'The variables have {size} combinations, '
+                         f'{n} students need different ones')
+
+    pool = None
+    if unique and size <= dense_factor * n:
+        pool = grid_permutation(seed, size)
+
+    def draw(rows, attempt):
+        if pool is None:
+            digits = grid_digits(uniform(seed, numbers[rows], len(names),
+                                         attempt), levels)
+        else:
+            digits = decode(pool[:len(rows)], levels)
+        return digit_values(digits, low, step, decimals)
+
+    def rejected(rows):
+        failed = np.zeros(len(rows), dtype=bool)
+        if expressions:
+            selection = None if students is None else students.iloc[rows]
+            frame = variable_frame(values[rows], names, selection, derived)
+            failed |= violations(frame, expressions)
+        if unique:
+            pending = np.zeros(n, dtype=bool)
+            pending[rows] = True
+            failed |= duplicates(values, numbers, pending)[rows]
+        return failed
+
+    rows = np.arange(n)
+    values = draw(rows, 0)
+    if pool is not None:
+        pool = pool[n:]
+
+    pending = rows[rejected(rows)]
+
+    iterations = 0
+    total = n
+    rejected_draws = len(pending)
+
+    while len(pending) and iterations < max_iterations:
+        # a permutation can run out of tuples before every student is done
+        rows = pending if pool is None else pending[:len(pool)]
+        if not len(rows):
+            break
+
+        iterations += 1
+
+        values[rows] = draw(rows, iterations)
+        if pool is not None:
+            pool = pool[len(rows):]
+
+        failed = rows[rejected(rows)]
+        pending = np.concatenate([failed, pending[len(rows):]])
+        total += len(rows)
+        rejected_draws += len(failed)
+
+    variables = pd.DataFrame(values, columns=names, copy=False)
+
+    if derived:
+        frame = variable_frame(values, names, students, derived)
+        for name, _, _ in derived:
+            variables[name] = frame[name].to_numpy()
+
+        order = var_config['Variable'].astype(str)
+        variables = variables[[name for name in order if name in variables]]
+
+    if report:
+        return variables, {'iterations': iterations,
+                           'draws': total,
+                           'rejected': rejected_draws,
+                           'rejection rate': rejected_draws / max(total, 1),
+                           'unsatisfied': len(pending)}
+
+    return variables
+
+
+def generate_student(var_config, numbers, row, seed, taken, students=None,
+                     max_iterations=100):
+    """ Generates again the variables of one student in unique mode: the
+        first of its candidate tuples that no other student has and that
+        meets the constraints. The candidates are the attempts of its
+        stream or, for dense grids, its slot of the grid permutation and
+        then the tuples generate() had left, so a student that was not
+        drawn again gets the same values as in generate().
+
+    Args:
+        var_config (DataFrame): Variable configuration
+        numbers (array): Student numbers, in the order given to generate()
+        row (int): Position of the student in numbers
+        seed (int): Assignment seed
+        taken (array): Drawn variable values of the other students, one
+                       row per student
+        students (DataFrame, optional): Student data of the student (one
+                                        row), used by the constraints and
+                                        derived variables. Defaults to None.
+        max_iterations (int, optional): Attempts of the stream tried after
+                                        the first one. Defaults to 100.
+
+    Returns:
+        DataFrame: variables of the student (one row)
+
+    Raises:
+        ValueError: If no candidate is free and meets the constraints
+    """
+
+    names, low, step, levels, decimals = variable_grid(var_config)
+    expressions = constraints(var_config)
+    derived = derived_variables(var_config)
+    numbers = np.asarray(numbers, dtype=np.int64)
+    n = len(numbers)
+    size = combinations(levels)
+
+    if size <= dense_factor * n:
+        pool = grid_permutation(seed, size)
+        candidates = np.concatenate([pool[row:row + 1], pool[n:],
+                                     pool[:row], pool[row + 1:n]])
+        digits = decode(candidates, levels)
+    else:
+        draws = [uniform(seed, numbers[row:row + 1], len(names), attempt)
+                 for attempt in range(max_iterations + 1)]
+        digits = grid_digits(np.concatenate(draws), levels)
+
+    values = digit_values(digits, low, step, decimals)
+
+    # candidates equal to the tuple of another student
+    taken = np.asarray(taken, dtype=float).reshape(-1, len(names)) + 0.0
+    tuples = pd.DataFrame(np.concatenate([taken, values]), copy=False)
+    failed = tuples.duplicated().to_numpy()[len(taken):]
+
+    if students is not None:
+        students = students.iloc[np.zeros(len(values), dtype=int)]
+    frame = variable_frame(values, names, students, derived)
+
+    if expressions:
+        failed = failed | violations(frame, expressions)
+
+    free = np.flatnonzero(~failed)
+    if not len(free):
+        raise ValueError(f'Student {numbers[row]}: no free tuple of '
+                         f'variables meets the constraints')
+
+    order = [name for name in var_config['Variable'].astype(str)
+             if name in frame]
+
+    return frame.loc[free[:1], order].reset_index(drop=True)
@@ -0,0 +1,312 @@
+from PyPDF2 import PdfFileWriter
+from PyPDF2.generic import DictionaryObject, NameObject, StreamObject
+import numpy as np
+import hashlib
+import pandas as pd
+import os
+import textwrap
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from . import gui
+from . import templates
+from .generate_pdf import SheetManifest, encrypt
+
+# Page layout (A4, points). Courier has a fixed width of 0.6 em, so lines
+# are wrapped exactly without font metrics.
+page_width = 595
+page_height = 842
+margin = 56
+font_size = 11
+heading_size = 13
+leading = 1.3
+
+
+def render_pdfs(assignment, template_file, workers=1):
+    """ Creates the PDF sheet of every student from a text template, without
+        the Word mail-merge. The template placeholders ([[V1]], [[name]],
+        [[number]], [[Assignment name]]...) are filled with the variables,
+        student data and configuration.
+
+        Template format: plain text, lines starting with '# ' are headings
+        and a line with only '---' starts a new page.
+        In headless mode (see gui.set_headless) the files are created before
+        returning, without progress widget.
+
+    Args:
+        assignment (Assignment): Assignment object.
+        template_file (str): Template file path.
+        workers (int, optional): Number of processes. Defaults to 1.
+    """
+
+    # password to encryp the files
+    password = assignment.config['Value'][8]
+
+    # sets the password to False if it is empty
+    if password.isspace() or (not password):
+        password = False
+
+    print('------')
+    print("Creating files")
+
+    # creates pdf and show progress bar in Jupyter
+    progress = gui.progress_bar()
+    args = (assignment, template_file, password, progress, workers)
+
+    if gui.headless:
+        render_sheets(*args)
+    else:
+        thread = threading.Thread(target=render_sheets, args=args)
+        thread.start()
+
+
+def render_sheets(assignment, template_file, password, progress, workers=1,
+                  chunks=None):
+    """ Renders the sheet of every student in student_list['file']
+
+    Args:
+        assignment (Assignment): Assignment object.
+        template_file (str): Template file path.
+        password (str or bool): Password to encrypt documents. If set to false
+                                documents are no encrypted.
+        progress (widget): Progress bar ipywidget
+        workers (int, optional): Number of processes. Defaults to 1.
+        chunks (int, optional): Number of chunks in parallel mode.
+                                Defaults to 4 chunks per process.
+
+    Returns:
+        [bool]: Returns True if the execution is successful.
+    """
+
+    template = templates.load_template(template_file, assignment)
+    values = sheet_values(assignment)
+    files = assignment.student_list['file'].to_list()
+    total = len(files)
+
+    # the manifest of split_pdf() does not describe these sheets
+    SheetManifest().clear()
+
+    if workers > 1:
+        if chunks is None:
+            chunks = 4 * workers
+
+        bounds = np.linspace(0, total, min(chunks, total) + 1).astype(int)
+        done = 0
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_render_worker,
+                                 initargs=(template, password)) as executor:
+
+            futures = [executor.submit(_render_chunk,
+                                       values[start:stop],
+                                       files[start:stop])
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+
+            for future in as_completed(futures):
+                done += future.result()
+                progress.value = float(done) / total
+    else:
+        for i in range(total):
+            write_text_sheet(template.render(values[i]), password, files[i])
+            progress.value = float(i + 1) / total
+
+    print("Files created")
+
+    return True
+
+
+def sheet_values(assignment):
+    """ Gets the placeholder values of every student: variables and student
+        data (the variables are used if a name is in both)
+
+    Args:
+        assignment (Assignment): Assignment object.
+
+    Returns:
+        [dict]: values of each student, in student_list order
+    """
+
+    students = assignment.student_list.drop(columns='file', errors='ignore')
+    variables = format_variables(assignment.variables, assignment.var_config)
+    variables = variables.set_index('number')
+    variables = variables.reindex(students['number'])
+
+    students = students.to_dict('records')
+    variables = variables.to_dict('records')
+
+    return [{**student, **row} for student, row in zip(students, variables)]
+
+
+def format_variables(variables, var_config):
+    """ Formats the variables with the decimals of var_config (e.g. 3 and
+        5.50 instead of 3.0 and 5.5), as they are graded
+
+    Args:
+        variables (DataFrame): Variables of the students
+        var_config (DataFrame): Variable configuration
+
+    Returns:
+        DataFrame: variables, the configured ones as text
+    """
+
+    variables = variables.copy()
+
+    for name, decimals in zip(var_config['Variable'],
+                              var_config['Decimals']):
+        decimals = pd.to_numeric(decimals, errors='coerce')
+        if name not in variables or pd.isna(decimals):
+            continue
+
+        values = pd.to_numeric(variables[name], errors='coerce')
+        variables[name] = [f'{value:.{int(decimals)}f}'
+                           if not pd.isna(value) else ''
+                           for value in values]
+
+    return variables
+
+
+def layout_text(text):
+    """ Splits a text in pages of wrapped lines
+
+    Args:
+        text (str): Sheet text
+
+    Returns:
+        [[(bool, str)]]: lines of each page as (heading, line)
+    """
+
+    pages = [[]]
+    height = 0
+    available = page_height - 2 * margin
+
+    for paragraph in text.splitlines():
+        if paragraph.strip() == '---':
+            pages.append([])
+            height = 0
+            continue
+
+        heading = paragraph.startswith('# ')
+        if heading:
+            paragraph = paragraph[2:]
+
+        size = heading_size if heading else font_size
+        width = int((page_width - 2 * margin) / (0.6 * size))
+        lines = textwrap.wrap(paragraph, width) or ['']
+
+        for line in lines:
+            if height + size * leading > available:
+                pages.append([])
+                height = 0
+            pages[-1].append((heading, line))
+            height += size * leading
+
+    return pages
+
+
+def page_content(lines):
+    """ Creates the content stream of a page
+
+    Args:
+        lines ([(bool, str)]): (heading, line) of each line
+
+    Returns:
+        bytes: PDF content stream
+    """
+
+    content = ['BT', f'{margin} {page_height - margin} Td']
+
+    for heading, line in lines:
+        name, size = ('/F2', heading_size) if heading else ('/F1', font_size)
+        line = line.replace('\\', '\\\\').replace('(', '\\(')
+        line = line.replace(')', '\\)')
+        content.append(f'{name} {size} Tf 0 {-size * leading:.2f} Td '
+                       f'({line}) Tj')
+
+    content.append('ET')
+
+    return '\n'.join(content).encode('cp1252', errors='replace')
+
+
+def font(name):
+    """ Creates a standard Type 1 font dictionary
+
+    Args:
+        name (str): Font name (e.g. Courier)
+
+    Returns:
+        DictionaryObject: font
+    """
+
+    return DictionaryObject({NameObject('/Type'): NameObject('/Font'),
+                             NameObject('/Subtype'): NameObject('/Type1'),
+                             NameObject('/BaseFont'): NameObject('/' + name),
+                             NameObject('/Encoding'):
+                                 NameObject('/WinAnsiEncoding')})
+
+
+def write_text_sheet(text, password, output_file):
+    """ Writes the sheet of a student
+
+    Args:
+        text (str): Sheet text (template filled with the student values)
+        password (str or bool): Password to encrypt the document. If set to
+                                false the document is not encrypted.
+        output_file (str): Output file.
+    """
+
+    pdf_writer = PdfFileWriter()
+
+    fonts = DictionaryObject({NameObject('/F1'): font('Courier'),
+                              NameObject('/F2'): font('Courier-Bold')})
+    resources = DictionaryObject({NameObject('/Font'): fonts})
+    resources = pdf_writer._addObject(resources)
+
+    digest = hashlib.sha256()
+
+    for lines in layout_text(text):
+        page = pdf_writer.addBlankPage(page_width, page_height)
+        content = StreamObject()
+        content._data = page_content(lines)
+        digest.update(content._data)
+        page[NameObject('/Contents')] = pdf_writer._addObject(content)
+        page[NameObject('/Resources')] = resources
+
+    if password:
+        encrypt(pdf_writer, password, os.path.basename(output_file),
+                digest.hexdigest())
+
+    with open(output_file, 'wb') as out:
+        pdf_writer.write(out)
+
+
+# Template and password of each render process
+_worker = {}
+
+
+def _init_render_worker(template, password):
+    """ Stores the template and the password in a render process
+
+    Args:
+        template (Template): Sheet template.
+        password (str or bool): Password to encrypt documents.
+    """
+
+    _worker['template'] = template
+    _worker['password'] = password
+
+
+def _render_chunk(values, files):
+    """ Renders the sheets of a range of students in a render process
+
+    Args:
+        values ([dict]): Placeholder values of each student.
+        files ([str]): Output file of each student.
+
+    Returns:
+        int: number of documents written
+    """
+
+    for student, output_file in zip(values, files):
+        write_text_sheet(_worker['template'].render(student),
+                         _worker['password'], output_file)
+
+    return len(files)
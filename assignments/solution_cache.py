@@ -0,0 +1,138 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pandas as pd
+from . import storage
+
+
+class SolutionCache:
+    """ Solutions found by previous runs of generate_solutions(), keyed by
+        a hash of the solver and of the variables of each student. Only the
+        solutions of the last solver are kept: editing the solver empties
+        the cache.
+    """
+
+    def __init__(self, path='gen/solution_cache.json'):
+        self.path = path
+
+    def load(self, solver):
+        """ Loads the solutions of a solver
+
+        Args:
+            solver (str): Solver key (see solver_key)
+
+        Returns:
+            dict: solutions (list of apN values) by variables key
+        """
+
+        if not os.path.isfile(self.path):
+            return {}
+
+        with open(self.path, 'r') as f:
+            try:
+                cache = json.load(f)
+            except ValueError:
+                return {}
+
+        if cache.get('solver') != solver:
+            return {}
+
+        return cache.get('solutions', {})
+
+    def save(self, solver, solutions):
+        """ Saves the solutions of a solver replacing the previous ones
+
+        Args:
+            solver (str): Solver key (see solver_key)
+            solutions (dict): solutions (list of apN values) by variables
+                              key
+        """
+
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump({'solver': solver, 'solutions': solutions}, f)
+
+        storage.atomic_write(self.path, write)
+
+
+def solver_code(solver):
+    """ Gets the code that identifies a solver: its source code, or its
+        bytecode if the source is not available. For functools.partial the
+        code of the wrapped function and the fixed arguments are used, and
+        for callable objects the code of their __call__ method.
+
+    Args:
+        solver (function): Solver function or callable
+
+    Returns:
+        bytes: solver code
+
+    Raises:
+        ValueError: If the code of the solver cannot be found (the cache
+                    cannot be used)
+    """
+
+    if isinstance(solver, functools.partial):
+        return (solver_code(solver.func) + repr(solver.args).encode() +
+                repr(sorted(solver.keywords.items())).encode())
+
+    if not inspect.isroutine(solver):
+        solver = type(solver).__call__
+
+    try:
+        return inspect.getsource(solver).encode()
+    except (OSError, TypeError):
+        pass
+
+    code = getattr(solver, '__code__', None)
+    if code is None:
+        raise ValueError(f'Solver {solver!r}: the source code is not '
+                         f'available, run it without cache')
+
+    return code.co_code + repr(code.co_consts).encode()
+
+
+def solver_key(solver, variables, na):
+    """ Computes the key of a solver: a hash of its code (see solver_code),
+        the variable names and the number of answers. Functions called by
+        the solver are not included.
+
+    Args:
+        solver (function): Solver function
+        variables (DataFrame): Variables of the students
+        na (int): Number of answers per student
+
+    Returns:
+        str: solver key
+    """
+
+    digest = hashlib.sha1(solver_code(solver))
+    digest.update(repr(list(variables.columns)).encode())
+    digest.update(str(na).encode())
+
+    return digest.hexdigest()
+
+
+def variable_keys(variables):
+    """ Computes the key of each student: a hash of its row of variables
+        (number and name included). Numeric columns are hashed as floats,
+        so an integer 3 and a float 3.0 (e.g. after saving the variables in
+        a XLSX file) give the same key.
+
+    Args:
+        variables (DataFrame): Variables of the students
+
+    Returns:
+        [str]: key of each row
+    """
+
+    variables = variables.copy()
+    for column in variables.select_dtypes('number').columns:
+        # + 0.0 turns -0.0 into 0.0
+        variables[column] = variables[column].to_numpy(dtype=float) + 0.0
+
+    rows = pd.util.hash_pandas_object(variables, index=False).to_numpy()
+
+    return [format(row, '016x') for row in rows]
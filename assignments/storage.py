@@ -0,0 +1,358 @@
+import pandas as pd
+import functools
+import hashlib
+import os
+import tempfile
+
+
+class ExcelStorage:
+    """ Stores all the sheets in a single XLSX workbook
+    """
+
+    name = 'xlsx'
+    # The workbook is a single file, all the sheets are written every time
+    partial = False
+
+    def __init__(self, path='gen/data.xlsx'):
+        self.path = path
+        self._workbook = None
+        self._workbook_modified = None
+
+    def __getstate__(self):
+        # The open workbook can't be sent to other processes
+        state = self.__dict__.copy()
+        state['_workbook'] = None
+        return state
+
+    def exists(self):
+        """ Checks if the workbook exists
+
+        Returns:
+            bool: True if the workbook exists
+        """
+
+        return os.path.isfile(self.path)
+
+    def modified(self):
+        """ Gets the last modification time of the workbook
+
+        Returns:
+            float: modification time (seconds since the epoch)
+        """
+
+        return os.path.getmtime(self.path)
+
+    def workbook(self):
+        """ Opens the workbook (read-only) once. It is opened again only if
+            the file has changed since.
+
+        Returns:
+            ExcelFile: open workbook
+        """
+
+        modified = self.modified()
+
+        if self._workbook is None or self._workbook_modified != modified:
+            self.close()
+            self._workbook = pd.ExcelFile(self.path, engine='openpyxl')
+            self._workbook_modified = modified
+
+        return self._workbook
+
+    def close(self):
+        """ Closes the workbook if it is open
+        """
+
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+    def load(self, sheet):
+        """ Loads a sheet from the workbook. Only this sheet is parsed.
+
+        Args:
+            sheet (str): Sheet name
+
+        Returns:
+            DataFrame: sheet data
+        """
+
+        return self.workbook().parse(sheet)
+
+    def save(self, frames):
+        """ Saves all the sheets to the workbook
+
+        Args:
+            frames (dict): DataFrame of each sheet name
+
+        Returns:
+            dict: errors of the sheets that couldn´t be saved
+        """
+
+        errors = {}
+        self.close()
+
+        def write(path):
+            with pd.ExcelWriter(path, engine='openpyxl') as writer:
+                for sheet, frame in frames.items():
+                    try:
+                        frame.to_excel(writer, sheet_name=sheet, index=False)
+                    except ValueError as ve:
+                        errors[sheet] = ve
+
+        atomic_write(self.path, write)
+
+        return errors
+
+
+class ParquetStorage:
+    """ Stores each sheet in its own Parquet file inside a folder. Sheets
+        without columns are not written.
+    """
+
+    name = 'parquet'
+    extension = '.parquet'
+    # Each sheet has its own file, only the modified sheets are written
+    partial = True
+
+    def __init__(self, path='gen/data'):
+        self.path = path
+
+    def sheet_path(self, sheet):
+        """ Gets the file path of a sheet
+
+        Args:
+            sheet (str): Sheet name
+
+        Returns:
+            str: file path
+        """
+
+        return os.path.join(self.path, sheet + self.extension)
+
+    def sheet_files(self):
+        """ Lists the sheet files in the folder
+
+        Returns:
+            [str]: sheet file paths
+        """
+
+        if not os.path.isdir(self.path):
+            return []
+
+        # Hidden files are temporary files of unfinished saves
+        return [os.path.join(self.path, file)
+                for file in os.listdir(self.path)
+                if file.endswith(self.extension)
+                and not file.startswith('.')]
+
+    def exists(self):
+        """ Checks if there is any sheet file in the folder
+
+        Returns:
+            bool: True if the folder has sheet files
+        """
+
+        return bool(self.sheet_files())
+
+    def modified(self):
+        """ Gets the last modification time of the sheet files
+
+        Returns:
+            float: modification time (seconds since the epoch)
+        """
+
+        return max(os.path.getmtime(file) for file in self.sheet_files())
+
+    def load(self, sheet):
+        """ Loads a sheet from its file
+
+        Args:
+            sheet (str): Sheet name
+
+        Returns:
+            DataFrame: sheet data, empty if the sheet has no file
+        """
+
+        path = self.sheet_path(sheet)
+
+        if not os.path.isfile(path):
+            return pd.DataFrame()
+
+        frame = self.read(path)
+
+        # Text columns are object columns, as in the XLSX storage, so they
+        # accept other values (e.g. numbers in the configuration)
+        for column in frame.columns:
+            if pd.api.types.is_string_dtype(frame[column].dtype):
+                frame[column] = frame[column].astype(object)
+
+        return frame
+
+    def save(self, frames):
+        """ Saves the sheets to their files. Each file is replaced
+            atomically and the files of other sheets are not modified.
+
+        Args:
+            frames (dict): DataFrame of each sheet name
+
+        Returns:
+            dict: errors of the sheets that couldn´t be saved
+        """
+
+        os.makedirs(self.path, exist_ok=True)
+
+        errors = {}
+
+        for sheet, frame in frames.items():
+            path = self.sheet_path(sheet)
+            try:
+                if frame.columns.empty:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                else:
+                    frame = columnar_frame(frame)
+                    atomic_write(path, functools.partial(self.write, frame))
+            except (ValueError, TypeError) as e:
+                errors[sheet] = e
+
+        return errors
+
+    def read(self, path):
+        return pd.read_parquet(path)
+
+    def write(self, frame, path):
+        frame.to_parquet(path, index=False)
+
+
+class FeatherStorage(ParquetStorage):
+    """ Stores each sheet in its own Feather file inside a folder. Sheets
+        without columns are not written.
+    """
+
+    name = 'feather'
+    extension = '.feather'
+
+    def read(self, path):
+        return pd.read_feather(path)
+
+    def write(self, frame, path):
+        frame.to_feather(path)
+
+
+backends = {
+    'xlsx': ExcelStorage,
+    'parquet': ParquetStorage,
+    'feather': FeatherStorage
+}
+
+
+def get_storage(name):
+    """ Creates the storage for a backend name
+
+    Args:
+        name (str): Backend name (xlsx, parquet or feather)
+
+    Returns:
+        ExcelStorage, ParquetStorage or FeatherStorage: storage object
+    """
+
+    try:
+        return backends[name]()
+    except KeyError:
+        raise ValueError(f'Unknown storage backend {name}, '
+                         f'use one of {list(backends)}')
+
+
+def find_storage():
+    """ Finds the data stored on disk. If there are several stores, the
+        most recently modified one is used.
+
+    Returns:
+        ExcelStorage, ParquetStorage or FeatherStorage: storage object or
+        None if there is no data on disk
+    """
+
+    stores = [backend() for backend in backends.values()]
+    stores = [store for store in stores if store.exists()]
+
+    if not stores:
+        return None
+
+    return max(stores, key=lambda store: store.modified())
+
+
+def atomic_write(path, write):
+    """ Writes a file through a temporary file in the same folder that
+        replaces the original one when it is complete. An interrupted save
+        never leaves a half written file.
+
+    Args:
+        path (str): File path
+        write (function): Function that writes the data, write(path)
+    """
+
+    folder, name = os.path.split(path)
+    extension = os.path.splitext(name)[1]
+    handle, temp_path = tempfile.mkstemp(prefix='.' + name,
+                                         suffix=extension,
+                                         dir=folder or '.')
+    os.close(handle)
+
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def fingerprint(frame):
+    """ Computes a hash of the contents of a DataFrame to detect changes
+        made in place
+
+    Args:
+        frame (DataFrame): sheet data
+
+    Returns:
+        str: hash of the data or None if the data can't be hashed
+    """
+
+    try:
+        rows = pd.util.hash_pandas_object(frame, index=True).to_numpy()
+    except TypeError:
+        return None
+
+    digest = hashlib.sha1(rows.tobytes())
+    digest.update(repr(list(frame.columns)).encode())
+    digest.update(repr(list(frame.dtypes.astype(str))).encode())
+
+    return digest.hexdigest()
+
+
+# Inferred types of object columns that columnar formats can't store
+mixed_types = ('mixed', 'mixed-integer')
+
+
+def columnar_frame(frame):
+    """ Prepares a DataFrame for columnar formats: drops the index, uses
+        string column names and converts columns with mixed types (as the
+        configuration values) to strings.
+
+    Args:
+        frame (DataFrame): sheet data
+
+    Returns:
+        DataFrame: sheet data ready to be written
+    """
+
+    frame = frame.reset_index(drop=True)
+    frame.columns = frame.columns.astype(str)
+
+    for column in frame.columns:
+        if pd.api.types.infer_dtype(frame[column]) in mixed_types:
+            frame[column] = frame[column].map(lambda v: v if pd.isna(v)
+                                              else str(v))
+
+    return frame
@@ -0,0 +1,89 @@
+import codecs
+import os
+import re
+import threading
+
+
+class Template:
+    """ Email template split once in text segments and [[key]]
+        placeholders. Known values (e.g. the configuration) are substituted
+        when the template is created, so rendering a message only joins the
+        remaining segments with the values of the student.
+    """
+
+    pattern = re.compile(r'\[\[(.+?)\]\]')
+
+    def __init__(self, text, values=None):
+        """
+        Args:
+            text (str): Template text
+            values (dict, optional): Values substituted in the template.
+                                     Defaults to None.
+        """
+
+        values = values or {}
+        parts = self.pattern.split(text)
+
+        # literals[k] goes before keys[k], the last literal goes at the end
+        self.literals = [parts[0]]
+        self.keys = []
+
+        for key, literal in zip(parts[1::2], parts[2::2]):
+            if key in values:
+                self.literals[-1] += str(values[key]) + literal
+            else:
+                self.keys.append(key)
+                self.literals.append(literal)
+
+    def render(self, values):
+        """ Fills the placeholders of the template in a single pass.
+            Placeholders without value are left as they are.
+
+        Args:
+            values (dict): Value of each placeholder (e.g. {'name': name})
+
+        Returns:
+            str: rendered text
+        """
+
+        parts = [self.literals[0]]
+
+        for key, literal in zip(self.keys, self.literals[1:]):
+            if key in values:
+                parts.append(str(values[key]))
+            else:
+                parts.append('[[' + key + ']]')
+            parts.append(literal)
+
+        return ''.join(parts)
+
+
+# Templates already read, by path, modification time and configuration
+_templates = {}
+_lock = threading.Lock()
+
+
+def load_template(path, assignment):
+    """ Gets the template of a file with the configuration of an assignment
+        substituted. The file is read and split only once while neither the
+        file nor the configuration change.
+
+    Args:
+        path (str): Template file path
+        assignment (Assignment): Assignment object
+
+    Returns:
+        Template: email template
+    """
+
+    config = assignment.config
+    pairs = zip(config['Variable'], config['Value'])
+    values = {variable: str(value) for variable, value in pairs}
+    key = (path, os.path.getmtime(path), tuple(values.items()))
+
+    with _lock:
+        if key not in _templates:
+            with codecs.open(path, 'r') as f:
+                _templates[key] = Template(f.read(), values)
+
+        return _templates[key]
@@ -0,0 +1,201 @@
+import email.utils
+import random
+import threading
+import time
+
+# HTTP status codes of throttled (429) and transient server errors
+retry_status = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """ Limits the rate of requests shared by several threads. Each request
+        takes a token and tokens are refilled at a constant rate up to the
+        bucket capacity.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Tokens added per second (positive).
+            capacity (float, optional): Maximum number of tokens (burst
+                                        size, at least 1). Defaults to rate.
+        """
+
+        if not rate > 0:
+            raise ValueError(f'The rate must be positive, got {rate}')
+
+        self.rate = rate
+        self.capacity = max(1, capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Waits until a token is available and takes it
+        """
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.updated
+                self.tokens = min(self.capacity,
+                                  self.tokens + elapsed * self.rate)
+                self.updated = now
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """ Stops handing tokens for some time (e.g. after a 429 response
+            with a Retry-After header), for all the threads
+
+        Args:
+            seconds (float): Pause time
+        """
+
+        with self.lock:
+            until = time.monotonic() + seconds
+            self.paused_until = max(self.paused_until, until)
+            self.tokens = 0.0
+
+
+def status_code(error):
+    """ Gets the HTTP status code of a request error
+
+    Args:
+        error (Exception): Error raised sending a message
+
+    Returns:
+        int: status code or None if the error has no HTTP response
+    """
+
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def retry_after(error):
+    """ Reads the Retry-After header of a request error
+
+    Args:
+        error (Exception): Error raised sending a message
+
+    Returns:
+        float: seconds to wait or None if there is no header
+    """
+
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After')
+
+    if value is None:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+def is_transient(error):
+    """ Checks if a request error is worth retrying: throttling, server
+        errors and connection errors (no HTTP response)
+
+    Args:
+        error (Exception): Error raised sending a message
+
+    Returns:
+        bool: True if the request can be retried
+    """
+
+    status = status_code(error)
+
+    if status is None:
+        return isinstance(error, OSError)
+
+    return status in retry_status
+
+
+def backoff(attempt, base_delay, max_delay):
+    """ Exponential backoff delay with full jitter
+
+    Args:
+        attempt (int): Number of failed attempts
+        base_delay (float): Delay after the first failure (seconds)
+        max_delay (float): Maximum delay (seconds)
+
+    Returns:
+        float: seconds to wait
+    """
+
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def send_with_retry(send, bucket=None, retries=5, base_delay=1.0,
+                    max_delay=60.0):
+    """ Sends a message retrying throttled and transient errors with
+        exponential backoff. The Retry-After header of the response is
+        honored and pauses the bucket for every thread.
+
+    Args:
+        send (function): Function that sends the message, send(), and
+                         returns True if it is sent.
+        bucket (TokenBucket, optional): Rate limiter. Defaults to None.
+        retries (int, optional): Maximum number of retries. Defaults to 5.
+        base_delay (float, optional): Delay after the first failure
+                                      (seconds). Defaults to 1.
+        max_delay (float, optional): Maximum delay (seconds).
+                                     Defaults to 60.
+
+    Returns:
+        dict: sent status, number of attempts, latency (s) and last error
+    """
+
+    start = time.perf_counter()
+    attempts = 0
+    sent = False
+    error = None
+
+    while attempts <= retries:
+        if bucket is not None:
+            bucket.acquire()
+
+        attempts += 1
+        try:
+            sent = bool(send())
+            error = None
+        except Exception as e:
+            sent = False
+            error = e
+            if not is_transient(e):
+                break
+
+        if sent or attempts > retries:
+            break
+
+        delay = retry_after(error)
+        if delay is None:
+            delay = backoff(attempts, base_delay, max_delay)
+        elif bucket is not None:
+            bucket.pause(delay)
+
+        time.sleep(delay)
+
+    return {'sent': sent,
+            'attempts': attempts,
+            'latency (s)': time.perf_counter() - start,
+            'error': error}
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+from assignments import cli
+from assignments.assignment import Assignment
+
+
+def test_generate_variables_options(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    assignment = Assignment()
+    assignment.config = pd.DataFrame({'Variable': ['Assignment name'],
+                                      'Value': ['Test']})
+    assignment.student_list = pd.DataFrame({'number': np.arange(1, 21),
+                                            'name': [f'Student {i}'
+                                                     for i in range(20)]})
+    assignment.var_config = pd.DataFrame({'Variable': ['V1', 'V2'],
+                                          'Min value': [1.0, 1.0],
+                                          'Max value': [3.0, 10.0],
+                                          'Step': [1.0, 1.0],
+                                          'Decimals': [0, 0]})
+    assignment.save_file()
+
+    assert cli.main(['generate-variables', '--seed', '42', '--unique',
+                     '--max-iterations', '5']) == 0
+
+    assignment = Assignment(True)
+    assert int(assignment.get_config('Random seed')) == 42
+    assert not assignment.variables[['V1', 'V2']].duplicated().any()
@@ -0,0 +1,119 @@
+import os
+import pandas as pd
+from PyPDF2 import PdfFileReader
+from assignments import benchmarks, generate_pdf, gui, render_pdf
+from assignments.assignment import Assignment
+
+
+def merged_pdf(path, texts):
+    # file with all the sheets, one page per student
+    render_pdf.write_text_sheet('\n---\n'.join(texts), False, path)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_full_split_updates_the_incremental_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('gen')
+    os.mkdir('sheets')
+
+    merged_pdf('A.pdf', ['Sheet A 1', 'Sheet A 2', 'Sheet A 3'])
+    merged_pdf('B.pdf', ['Sheet B 1', 'Sheet B 2', 'Sheet B 3'])
+
+    assignment = Assignment()
+    files = [os.path.join('sheets', f'{i}.pdf') for i in range(3)]
+    assignment.student_list = pd.DataFrame({'file': files})
+
+    def split(pdf_file, incremental):
+        generate_pdf.split_pdf(assignment, pdf_file, 1, False,
+                               gui.Progress(), incremental=incremental)
+        return [read(file) for file in files]
+
+    sheets_a = split('A.pdf', True)
+    sheets_b = split('B.pdf', False)
+    assert sheets_b != sheets_a
+
+    assert split('A.pdf', True) == sheets_a
+
+    # an unchanged file after a full split is not written again
+    split('B.pdf', False)
+    os.remove(files[0])
+    with open(files[1], 'wb') as f:
+        f.write(b'modified')
+    split('B.pdf', True)
+    assert read(files[0]) == sheets_b[0]
+    assert read(files[1]) == b'modified'
+
+
+def test_rendered_sheets_clear_the_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('gen')
+    os.mkdir('sheets')
+
+    merged_pdf('A.pdf', ['Sheet A 1'])
+
+    assignment = Assignment()
+    assignment.student_list = pd.DataFrame({'number': [1],
+                                            'file': ['sheets/0.pdf']})
+    assignment.variables = pd.DataFrame({'number': [1], 'V1': [2.0]})
+    assignment.var_config = pd.DataFrame({'Variable': ['V1'],
+                                          'Decimals': [0]})
+    assignment.config = pd.DataFrame({'Variable': ['Assignment name'],
+                                      'Value': ['Test']})
+
+    generate_pdf.split_pdf(assignment, 'A.pdf', 1, False, gui.Progress(),
+                           incremental=True)
+    sheet_a = read('sheets/0.pdf')
+
+    with open('template.txt', 'w') as f:
+        f.write('Rendered sheet, V1 = [[V1]]')
+    render_pdf.render_sheets(assignment, 'template.txt', False,
+                             gui.Progress())
+    assert read('sheets/0.pdf') != sheet_a
+
+    generate_pdf.split_pdf(assignment, 'A.pdf', 1, False, gui.Progress(),
+                           incremental=True)
+    assert read('sheets/0.pdf') == sheet_a
+
+
+def test_encryption_key_changes_with_the_content(tmp_path):
+    def sheet(text):
+        path = str(tmp_path / 'sheet.pdf')
+        render_pdf.write_text_sheet(text, 'secret', path)
+        pdf = PdfFileReader(path)
+        assert pdf.decrypt('secret')
+        assert 'Sheet' in pdf.getPage(0).extractText()
+        return read(path), pdf.trailer['/ID'][0]
+
+    first, id_first = sheet('Sheet, V1 = 1')
+    again, id_again = sheet('Sheet, V1 = 1')
+    other, id_other = sheet('Sheet, V1 = 2')
+
+    assert first == again
+    assert id_first == id_again
+    assert id_first != id_other
+
+
+def test_windowed_split_memory_stays_flat(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('gen')
+
+    peaks = []
+    for total in (30, 120):
+        benchmarks.synthetic_pdf('sheets.pdf', 2 * total, size=256)
+
+        assignment = Assignment()
+        files = [f'{i}.pdf' for i in range(total)]
+        assignment.student_list = pd.DataFrame({'file': files})
+
+        peaks.append([benchmarks.split_peak(assignment, 'sheets.pdf', 2,
+                                            window, password=False)
+                      for window in (None, 10)])
+
+    whole, window = [large / small for small, large in zip(*peaks)]
+
+    # the windowed peak only grows with the cross-reference table
+    assert window - 1 < (whole - 1) / 2
@@ -0,0 +1,11 @@
+import pandas as pd
+from assignments import benchmarks
+
+
+def test_vectorized_grading_matches_the_loop():
+    # one student in ten has no answer row
+    assignment = benchmarks.synthetic_assignment(60)
+
+    assert len(assignment.answers) < len(assignment.student_list)
+    pd.testing.assert_frame_equal(assignment.grade_points(),
+                                  assignment.grade_points_loop())
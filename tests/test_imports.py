@@ -0,0 +1,25 @@
+import os
+import pkgutil
+import subprocess
+import sys
+import pytest
+import assignments
+from assignments import benchmarks
+
+package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# every module of the package (__main__ runs the command line)
+modules = [f'assignments.{module.name}'
+           for module in pkgutil.iter_modules(assignments.__path__)
+           if module.name != '__main__']
+
+
+@pytest.mark.parametrize('module', modules)
+def test_deferred_modules_are_not_imported(module):
+    code = f'import sys\nimport {module}\nprint("\\n".join(sys.modules))'
+
+    output = subprocess.run([sys.executable, '-c', code], cwd=package,
+                            capture_output=True, text=True, check=True)
+    loaded = {name.split('.')[0] for name in output.stdout.split()}
+
+    assert not loaded & set(benchmarks.deferred_modules)
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from assignments import random_variables
+
+
+def test_generate_student_keeps_unique_tuples():
+    # 30 tuples for 10 students: drawn from the grid permutation
+    var_config = pd.DataFrame({'Variable': ['V1', 'V2'],
+                               'Min value': [1.0, 1.0],
+                               'Max value': [3.0, 10.0],
+                               'Step': [1.0, 1.0],
+                               'Decimals': [0, 0]})
+    numbers = np.arange(1, 11)
+
+    variables = random_variables.generate(var_config, numbers, 5,
+                                          unique=True).to_numpy(copy=True)
+
+    for row in range(len(numbers)):
+        others = np.delete(variables, row, axis=0)
+        values = random_variables.generate_student(var_config, numbers, row,
+                                                   5, others)
+        assert values.to_numpy()[0].tolist() == variables[row].tolist()
+
+    # the tuple of student 1 is given to student 2
+    variables[1] = variables[0]
+    values = random_variables.generate_student(var_config, numbers, 0, 5,
+                                               variables[1:])
+    variables[0] = values.to_numpy()[0]
+    assert not pd.DataFrame(variables).duplicated().any()
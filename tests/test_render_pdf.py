@@ -0,0 +1,31 @@
+import pandas as pd
+from assignments import render_pdf, templates
+from assignments.assignment import Assignment
+
+
+def test_sheet_values_use_configured_decimals():
+    assignment = Assignment()
+    assignment.student_list = pd.DataFrame({'number': [1, 2],
+                                            'id': [101, 102],
+                                            'name': ['Ana', 'Luis'],
+                                            'file': ['a.pdf', 'b.pdf']})
+    assignment.variables = pd.DataFrame({'number': [1, 2],
+                                         'name': ['Ana', 'Luis'],
+                                         'V1': [3.0, 12.0],
+                                         'V2': [5.5, 0.25]})
+    assignment.var_config = pd.DataFrame({'Variable': ['V1', 'V2'],
+                                          'Min value': [0.0, 0.0],
+                                          'Max value': [20.0, 10.0],
+                                          'Step': [1.0, 0.25],
+                                          'Decimals': [0, 2],
+                                          'Unit': ['', '']})
+
+    values = render_pdf.sheet_values(assignment)
+
+    assert values[0]['V1'] == '3'
+    assert values[0]['V2'] == '5.50'
+    assert values[1]['V1'] == '12'
+    assert values[1]['V2'] == '0.25'
+
+    template = templates.Template('[[name]]: V1 = [[V1]], V2 = [[V2]]')
+    assert template.render(values[0]) == 'Ana: V1 = 3, V2 = 5.50'
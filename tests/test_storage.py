@@ -0,0 +1,66 @@
+import os
+import pandas as pd
+from assignments.assignment import Assignment
+
+
+def columnar_assignment():
+    assignment = Assignment()
+    variables = ['Greeting', 'Assignment name', 'Assignment code',
+                 'Course name', 'Course code', 'Professor name',
+                 'Number of questions', 'Number of sheets', 'Password',
+                 'Storage backend', 'Random seed']
+    values = ['Hello', 'Test', 'T1', 'Course', 'C1', 'Professor', 4, 1,
+              'secret', 'parquet', 7]
+    assignment.config = pd.DataFrame({'Variable': variables,
+                                      'Value': values})
+    assignment.student_list = pd.DataFrame({'number': [1, 2],
+                                            'name': ['Ana', 'Luis']})
+    assignment.save_file()
+
+    return assignment
+
+
+def test_export_keeps_the_configured_storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    columnar_assignment().export_xlsx()
+
+    assert os.path.isfile('gen/mail_merge.xlsx')
+    assert not os.path.exists('gen/data.xlsx')
+    assert Assignment(True)._store.name == 'parquet'
+
+
+def test_columnar_config_accepts_new_values(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    columnar_assignment()
+
+    assignment = Assignment(True)
+    assignment.set_config('Random seed', 11)
+    assignment.set_na(5)
+    assignment.set_ns(2)
+
+    assignment = Assignment(True)
+    assert int(assignment.get_config('Random seed')) == 11
+    assert int(assignment.get_config('Number of questions')) == 5
+    assert int(assignment.get_config('Number of sheets')) == 2
+
+
+def test_xlsx_save_closes_the_open_workbook(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    assignment = Assignment()
+    assignment.config = pd.DataFrame({'Variable': ['Assignment name'],
+                                      'Value': ['Test']})
+    assignment.save_file()
+
+    assignment = Assignment(True)
+    store = assignment._store
+    assignment.config.loc[0, 'Value'] = 'Changed'
+    assert store._workbook is not None
+
+    assignment.save_file()
+
+    assert assignment._store is store
+    assert store._workbook is None
+    assert Assignment(True).get_config('Assignment name') == 'Changed'